@@ -1,29 +1,111 @@
-from PyQt5.QtWidgets import QMainWindow, QLabel, QScrollArea, QPushButton, QVBoxLayout, QFileDialog, QHBoxLayout, QGridLayout, QColorDialog, QTextEdit, QSlider, QAction
+import time
+_START = time.perf_counter()  # 用于统计从启动到窗口显示的耗时
+
+from PyQt5.QtWidgets import QMainWindow, QLabel, QScrollArea, QPushButton, QVBoxLayout, QFileDialog, QHBoxLayout, QGridLayout, QColorDialog, QTextEdit, QSlider, QAction, QComboBox, QListWidget, QListWidgetItem, QInputDialog
 from PyQt5.QtGui import QPixmap, QImage, QColor, QTextCursor, QTextCharFormat, QTransform
-from PyQt5.QtCore import Qt
-from PIL import Image, ImageDraw
-import numpy as np
-from util import *
+from PyQt5.QtCore import Qt, QThread, QTimer, pyqtSignal
+from startup import lazy_import, warm_up
+
+# NumPy、PIL 以及依赖它们的模块都延迟到第一次使用时再导入，窗口显示后在后台线程预热
+np = lazy_import("numpy")
+util = lazy_import("util")
+color_metric = lazy_import("color_metric")
+project = lazy_import("project")
+vector_export = lazy_import("vector_export")
+dxf_import = lazy_import("dxf_import")
+leak_guard = lazy_import("leak_guard")
+region_table = lazy_import("region_table")
+engine = lazy_import("engine")
+
+class DxfWorker(QThread):
+    """ 在后台线程中读取并栅格化 DXF，避免界面卡住 """
+    done = pyqtSignal(object, object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, width, cache, visible=None, rasterizer=None):
+        super().__init__()
+        self.path = path
+        self.width = width
+        self.cache = cache
+        self.visible = visible
+        self.rasterizer = rasterizer
+
+    def run(self):
+        try:
+            if self.rasterizer is None:
+                self.rasterizer = dxf_import.DxfRasterizer(self.path, self.width, cache=self.cache)
+            visible = self.rasterizer.layers if self.visible is None else self.visible
+            self.done.emit(self.rasterizer, self.rasterizer.composite(visible))
+        except Exception as e:
+            self.failed.emit(str(e))
 
 class ColorFillApp(QMainWindow):
+    warmed = pyqtSignal(str)  # 后台预热结束，携带导入耗时报告
+
     def __init__(self):
         super().__init__()
-        self.image = None
+        self._engine = None  # 填色引擎：图像、撤销栈、工程和区域表都在引擎里，第一次使用时创建
         self.log_count = 12
-        self.history = []
-        self.redo_stack = []
         self.current_color = (255, 0, 0)  # 默认红色
         self.tolerance = 36  # 默认容差
+        self.color_metric = None  # 颜色距离度量，启动完成后设为默认值
         self.log_messages = []  # 存储日志的列表
         self.current_tool = None  # 当前工具
         self.scale_factor = 1.0
         self.original_pixmap = None
+        self.dxf = None  # 当前打开的 DXF 栅格化器
+        self.dxf_worker = None
+        self.leak_gap = 0  # 防漏填充能封住的缺口宽度（像素），0 表示关闭
 
         self.debug = False
 
         self.initUI()
         self.resize(1920, 1080)
 
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = engine.FillEngine()
+        return self._engine
+
+    @property
+    def image(self):
+        return self._engine.image if self._engine is not None else None
+
+    @property
+    def history(self):
+        return self.engine.history
+
+    @property
+    def redo_stack(self):
+        return self.engine.redo_stack
+
+    @property
+    def project(self):
+        return self.engine.project
+
+    @property
+    def regions(self):
+        return self.engine.regions
+
+    @property
+    def page_cache(self):
+        # 每页渲染结果的磁盘缓存，与引擎共用
+        return self.engine.cache
+
+    def finish_startup(self, profile=False):
+        """ 窗口显示之后再完成的初始化：填充需要 NumPy 的控件，并在后台预热其余重模块 """
+        self.printLog(f"窗口启动耗时: {time.perf_counter() - _START:.2f}s", color="gray")
+        if profile:
+            self.warmed.connect(lambda report: self.printLog(report.replace("\n", "<br>"), color="gray"))
+        warm_up(callback=self.warmed.emit)
+
+        self.color_metric = color_metric.DEFAULT_METRIC
+        self.metric_combo.blockSignals(True)
+        self.metric_combo.addItems(color_metric.METRICS)
+        self.metric_combo.setCurrentText(self.color_metric)
+        self.metric_combo.blockSignals(False)
+
     def initUI(self):
         self.setWindowTitle("Archmark v0.0")
         self.setGeometry(100, 100, 1200, 800)
@@ -63,6 +145,10 @@ class ColorFillApp(QMainWindow):
         self.tolerance_slider.setTickPosition(QSlider.TicksBelow)
         self.tolerance_slider.valueChanged.connect(self.update_tolerance)
 
+        # 颜色度量选择
+        self.metric_combo = QComboBox(self)  # 选项在 finish_startup 中填充
+        self.metric_combo.currentTextChanged.connect(self.update_metric)
+
         # 当前颜色显示标签
         self.color_display = QLabel(self)
         self.color_display.setFixedSize(50, 50)
@@ -71,6 +157,13 @@ class ColorFillApp(QMainWindow):
         # 创建颜色选择栏
         self.color_palette = self.create_color_palette()
 
+        # DXF 图层列表，打开 DXF 后显示
+        self.layer_label = QLabel("DXF 图层")
+        self.layer_list = QListWidget(self)
+        self.layer_list.itemChanged.connect(self.toggle_layer)
+        self.layer_label.hide()
+        self.layer_list.hide()
+
         # 日志输出
         self.log_display = QTextEdit(self)
         self.log_display.setReadOnly(True)  # 设置为只读，不允许用户修改日志
@@ -90,6 +183,8 @@ class ColorFillApp(QMainWindow):
         color_layout = QVBoxLayout()
         color_layout.addWidget(self.tolerance_label)
         color_layout.addWidget(self.tolerance_slider)
+        color_layout.addWidget(QLabel("颜色度量"))
+        color_layout.addWidget(self.metric_combo)
         color_layout.addWidget(QLabel("当前颜色"))
         color_layout.addWidget(self.color_display)
         color_layout.addWidget(QLabel("选择颜色"))
@@ -99,6 +194,8 @@ class ColorFillApp(QMainWindow):
         sidebar_layout.addLayout(control_layout)
         sidebar_layout.addLayout(tool_layout)
         sidebar_layout.addLayout(color_layout)
+        sidebar_layout.addWidget(self.layer_label)
+        sidebar_layout.addWidget(self.layer_list)
 
         # 布局修改
         log_layout = QVBoxLayout()
@@ -123,14 +220,49 @@ class ColorFillApp(QMainWindow):
         menubar = self.menuBar()
         file_menu = menubar.addMenu("文件 Files")
         
-        save_action = QAction("保存 Save", self)
-        save_action.triggered.connect(self.save_image)
+        save_action = QAction("保存工程 Save Project", self)
+        save_action.triggered.connect(self.save_project)
+
+        save_as_action = QAction("工程另存为 Save Project As", self)
+        save_as_action.triggered.connect(lambda: self.save_project(save_as=True))
+
+        open_project_action = QAction("打开工程 Open Project", self)
+        open_project_action.triggered.connect(self.open_project)
+
+        export_action = QAction("导出图片 Export Image", self)
+        export_action.triggered.connect(self.save_image)
+
+        export_pdf_action = QAction("导出矢量PDF Export Vector PDF", self)
+        export_pdf_action.triggered.connect(self.export_pdf)
+
+        export_report_action = QAction("导出面积统计 Export Area Report", self)
+        export_report_action.triggered.connect(self.export_report)
+
+        mmap_action = QAction("大图模式（内存映射） Memory-mapped Mode", self)
+        mmap_action.setCheckable(True)
+        mmap_action.toggled.connect(self.set_mmap_mode)
+
+        session_log_action = QAction("保存操作日志 Save Session Log", self)
+        session_log_action.triggered.connect(self.save_session_log)
 
-        load_action = QAction("导入文件(PDF或者图片) Import File", self)
+        leak_action = QAction("防漏填充 Leak Guard", self)
+        leak_action.setCheckable(True)
+        leak_action.toggled.connect(self.set_leak_guard)
+
+        load_action = QAction("导入文件(PDF、DXF或者图片) Import File", self)
         load_action.triggered.connect(self.open_file)
         
         file_menu.addAction(load_action)
+        file_menu.addAction(open_project_action)
         file_menu.addAction(save_action)
+        file_menu.addAction(save_as_action)
+        file_menu.addAction(export_action)
+        file_menu.addAction(export_pdf_action)
+        file_menu.addAction(export_report_action)
+        file_menu.addSeparator()
+        file_menu.addAction(mmap_action)
+        file_menu.addAction(leak_action)
+        file_menu.addAction(session_log_action)
         
     def select_paint_bucket(self):
         """ 选择颜料桶工具 """
@@ -173,26 +305,134 @@ class ColorFillApp(QMainWindow):
         self.tolerance = self.tolerance_slider.value()
         self.tolerance_label.setText(f"容差: {self.tolerance}")
 
+    def update_metric(self, metric):
+        self.color_metric = metric
+        self.printLog(f"颜色度量: {metric}", color="blue")
+
     def open_file(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "打开文件", "", "PDF Files (*.pdf);;Image Files (*.png *.jpg *.bmp)")
+        file_path, _ = QFileDialog.getOpenFileName(self, "打开文件", "", "PDF Files (*.pdf);;CAD Files (*.dxf);;Image Files (*.png *.jpg *.bmp)")
+        if file_path and file_path.lower().endswith(".dxf"):
+            width, ok = QInputDialog.getInt(self, "DXF 分辨率", "栅格化宽度（像素）", dxf_import.DEFAULT_DXF_WIDTH, 500, 30000)
+            if ok:
+                self.dxf = None
+                self.start_dxf_render(file_path, width)
+            return
         if file_path:
-            if file_path.endswith(".pdf"):
-                self.image = self.rasterize_pdf(file_path)
-            else:
-                self.image = Image.open(file_path)
+            self.dxf = None
+            self.layer_label.hide()
+            self.layer_list.hide()
+            # PDF 再次打开时直接从磁盘缓存读取渲染结果
+            self.engine.open(file_path)
             self.scale_factor = 1.0
             self.display_image()
 
-    def rasterize_pdf(self, file_path):
-        import fitz  # PyMuPDF
-        doc = fitz.open(file_path)
-        pix = doc[0].get_pixmap(matrix=fitz.Matrix(2, 2))
-        image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        return image
+    def start_dxf_render(self, file_path, width, visible=None):
+        """ 启动后台线程栅格化 DXF；切换图层时复用已有的栅格化器，按记下的图元重画，不再重新遍历 DXF """
+        self.dxf_worker = DxfWorker(file_path, width, self.page_cache, visible, self.dxf)
+        self.dxf_worker.done.connect(self.on_dxf_rendered)
+        self.dxf_worker.failed.connect(lambda message: self.printLog(f"DXF 渲染失败: {message}", color="red", isBold=True))
+        self.dxf_worker.start()
+        self.printLog("正在后台渲染 DXF，请稍候...", color="blue", isBold=True)
+
+    def on_dxf_rendered(self, rasterizer, arr):
+        first_load = self.dxf is None
+        self.dxf = rasterizer
+        visible = self.visible_layers() if not first_load else rasterizer.layers
+        if first_load:
+            # 第一次打开时填充图层列表，默认全部可见
+            self.layer_list.blockSignals(True)
+            self.layer_list.clear()
+            for name in rasterizer.layers:
+                item = QListWidgetItem(name)
+                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Checked)
+                self.layer_list.addItem(item)
+            self.layer_list.blockSignals(False)
+            self.layer_label.show()
+            self.layer_list.show()
+            self.scale_factor = 1.0
+
+        self.engine.open(rasterizer.path, rasterizer.layout_name, rasterizer.width, visible, pixels=arr)
+        self.display_image()
+        self.printLog(f"DXF 渲染完成: {rasterizer.path}", color="green", isBold=True)
+
+    def visible_layers(self):
+        return [self.layer_list.item(i).text() for i in range(self.layer_list.count())
+                if self.layer_list.item(i).checkState() == Qt.Checked]
+
+    def toggle_layer(self, item):
+        """ 切换图层可见性：按记下的图元只重画可见图层，同一图层组合直接从缓存读取 """
+        if self.dxf is None:
+            return
+        busy = self.dxf_worker is not None and self.dxf_worker.isRunning()
+        if self.history or busy:
+            # 已经有填色或者正在渲染时不允许切换，恢复勾选状态
+            self.layer_list.blockSignals(True)
+            item.setCheckState(Qt.Unchecked if item.checkState() == Qt.Checked else Qt.Checked)
+            self.layer_list.blockSignals(False)
+            message = "正在渲染，请稍候" if busy else "已经有填色记录，不能再切换图层"
+            self.printLog(message, color="red", isBold=True)
+            return
+        self.start_dxf_render(self.dxf.path, self.dxf.width, self.visible_layers())
+
+    def set_mmap_mode(self, enabled):
+        self.engine.mapped = enabled
+        message = "已开启大图模式，之后打开的文件会放在内存映射文件中" if enabled else "已关闭大图模式"
+        self.printLog(message, color="blue", isBold=True)
+
+    def set_leak_guard(self, enabled):
+        """ 开启防漏填充：填充不越过宽度不超过 leak_gap 的线条缺口，并且超出面积/范围预算时取消 """
+        gap = 0
+        if enabled:
+            gap, ok = QInputDialog.getInt(self, "防漏填充", "能封住的最大缺口宽度（像素）", leak_guard.DEFAULT_GAP, 1, 50)
+            if not ok:
+                gap = 0
+        self.leak_gap = gap
+        message = f"已开启防漏填充，缺口宽度: {gap}" if gap else "已关闭防漏填充"
+        self.printLog(message, color="blue", isBold=True)
+
+    def save_session_log(self):
+        """ 保存本次会话的操作日志，可以用 python engine.py LOG 无界面重放并统计每个操作的耗时 """
+        file_path, _ = QFileDialog.getSaveFileName(self, "保存操作日志", "", "操作日志 (*.jsonl)")
+        if not file_path:
+            self.printLog("保存操作被取消", color="red", isBold=True)
+            return
+        self.engine.write_log(file_path)
+        self.printLog(f"已保存 {len(self.engine.oplog)} 条操作记录到: {file_path}", color="green", isBold=True)
+
+    def open_project(self):
+        """ 打开工程文件，在原图上重建编辑结果，撤销/重做的像素块按需加载 """
+        file_path, _ = QFileDialog.getOpenFileName(self, "打开工程", "", f"Archmark 工程 (*{project.PROJECT_EXT})")
+        if not file_path:
+            return
+        try:
+            self.engine.open_project(file_path)
+        except (OSError, ValueError) as e:
+            self.printLog(f"打开工程失败: {e}", color="red", isBold=True)
+            return
+        self.scale_factor = 1.0
+        self.display_image()
+        self.printLog(f"已打开工程: {file_path}", color="green", isBold=True)
+
+    def save_project(self, save_as=False):
+        """ 保存工程：只把上次保存之后的新编辑追加到工程文件 """
+        if self.project is None:
+            self.printLog("没有可保存的工程", color="red", isBold=True)
+            return
+        path = None
+        if save_as or self.project.path is None:
+            path, _ = QFileDialog.getSaveFileName(self, "保存工程", "", f"Archmark 工程 (*{project.PROJECT_EXT})")
+            if not path:
+                self.printLog("保存操作被取消", color="red", isBold=True)
+                return
+            if not path.endswith(project.PROJECT_EXT):
+                path += project.PROJECT_EXT
+        self.engine.save(path)
+        self.printLog(f"工程已保存到: {self.project.path}", color="green", isBold=True)
 
     def display_image(self):
         if self.image:
-            qt_image = self.pil_to_qimage(self.image)
+            qt_image = self.to_qimage(self.image)
             mypixmap = QPixmap.fromImage(qt_image)
             # self.image_label.setPixmap(mypixmap)
             self.original_pixmap = mypixmap
@@ -202,21 +442,21 @@ class ColorFillApp(QMainWindow):
             scaled_pixmap = self.original_pixmap.transformed(transform)
             self.image_label.setPixmap(scaled_pixmap)
 
-    def pil_to_qimage(self, image):
-        image = image.convert("RGBA")
-        data = image.tobytes("raw", "RGBA")
-        qimage = QImage(data, image.width, image.height, QImage.Format_RGBA8888)
-        return qimage
+    def to_qimage(self, image):
+        """ 直接用工作图像的像素缓冲区构造 QImage，不经过 PIL 转换 """
+        # 工作图像本身是连续数组，QImage 直接引用它的缓冲区，QPixmap.fromImage 时才拷贝一次
+        arr = np.ascontiguousarray(np.asarray(image))
+        return QImage(arr.data, arr.shape[1], arr.shape[0], arr.strides[0], QImage.Format_RGB888)
     
     def save_image(self):
-        """ 保存当前图像到指定路径 """
+        """ 把当前图像导出为图片文件 """
         if self.image is not None:
             # 打开文件保存对话框
             file_path, _ = QFileDialog.getSaveFileName(self, "保存图片", "", "PNG 图片 (*.png);;JPEG 图片 (*.jpg *.jpeg);;所有文件 (*.*)")
 
             if file_path:
                 # 如果文件路径不为空，保存图片
-                self.image.save(file_path)  # 使用PIL.Image.save保存图片
+                self.engine.export_image(file_path)
                 print(f"图片已保存到: {file_path}")
                 self.printLog(f"图片已保存到: {file_path}", color="green", isBold=True)
             else:
@@ -226,6 +466,46 @@ class ColorFillApp(QMainWindow):
             print("没有图像可保存")
             self.printLog("没有图像可保存", color="red", isBold=True)
 
+    def export_pdf(self):
+        """ 把填色区域转成矢量路径写回原 PDF，而不是导出位图 """
+        if self.project is None or not self.project.source["path"].lower().endswith(".pdf"):
+            self.printLog("只有从PDF导入的图纸才能导出矢量PDF", color="red", isBold=True)
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "导出矢量PDF", "", "PDF 文件 (*.pdf)")
+        if not file_path:
+            self.printLog("导出操作被取消", color="red", isBold=True)
+            return
+        count = vector_export.export_vector_pdf(self.project.source, self.image, self.history, file_path, cache=self.page_cache)
+        self.printLog(f"已导出 {count} 个填色轮廓到: {file_path}", color="green", isBold=True)
+
+    def export_report(self):
+        """ 导出每个填色区域的面积、边界框和重心（CSV 或 JSON），PDF 图纸按渲染倍率和图纸比例换算成平方米 """
+        if not len(self.regions):
+            self.printLog("还没有填色区域", color="red", isBold=True)
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "导出面积统计", "", "CSV 文件 (*.csv);;JSON 文件 (*.json)")
+        if not file_path:
+            self.printLog("导出操作被取消", color="red", isBold=True)
+            return
+
+        meters_per_px = None
+        source = self.project.source if self.project is not None else None
+        if source is not None and source.get("zoom"):
+            scale, ok = QInputDialog.getDouble(self, "图纸比例", "比例 1 :", 100, 1, 100000, 2)
+            if ok:
+                meters_per_px = region_table.meters_per_pixel(source["zoom"], scale)
+
+        if file_path.lower().endswith(".json"):
+            count = self.regions.to_json(file_path, meters_per_px)
+        else:
+            count = self.regions.to_csv(file_path, meters_per_px)
+        for color, area in self.regions.area_by_color():
+            line = f"rgb{color}: {area} 像素"
+            if meters_per_px is not None:
+                line += f"，{area * meters_per_px ** 2:.2f} 平方米"
+            self.printLog(line)
+        self.printLog(f"已导出 {count} 个区域的面积统计到: {file_path}", color="green", isBold=True)
+
     def mouse_click_event(self, event):
         if self.image:
             # 获取点击位置
@@ -292,36 +572,28 @@ class ColorFillApp(QMainWindow):
 
     def fill_color(self, x, y):
         if self.image:
-            # 保存当前图像状态，用于撤销
-            self.history.append(self.image.copy())
-            self.redo_stack.clear()  # 清除重做栈
-
-            img = self.image.copy()  # 使用副本
-            target_color = img.getpixel((x, y))  # 获取点击点颜色
+            target_color = self.image.getpixel((x, y))  # 获取点击点颜色
 
             print(f"点击位置 ({x}, {y}), 当前颜色: {target_color}, 填充颜色: {self.current_color}")
 
-            # 使用 Pillow 的 floodfill 方法
-            ImageDraw.floodfill(
-                img, (x, y), self.current_color, thresh=self.tolerance
-            )
+            # 填色、撤销记录和区域表都由引擎完成，图像原地修改
+            try:
+                self.engine.fill(x, y, self.current_color, self.tolerance, self.color_metric, self.leak_gap)
+            except util.FillBudgetExceeded as e:
+                self.printLog(f"填充范围过大，可能从缺口漏出，已取消（{e}）", color="red", isBold=True)
+                return
             self.printLog(f"填色成功！当前填充颜色: {self.current_color}", color="green", isBold=True)
 
             # 更新图像并显示
-            self.image = img
             self.display_image()
 
     def undo(self):
-        if self.history:
-            self.redo_stack.append(self.image)
-            self.image = self.history.pop()
+        if self.image and self.engine.undo():
             self.display_image()
             self.printLog(f"已撤销", color="blue", isBold=True)
 
     def redo(self):
-        if self.redo_stack:
-            self.history.append(self.image)
-            self.image = self.redo_stack.pop()
+        if self.image and self.engine.redo():
             self.display_image()
             self.printLog(f"已重做", color="blue", isBold=True)
 
@@ -347,71 +619,25 @@ class ColorFillApp(QMainWindow):
 # mode bucket
     def mode_paint_bucket(self, x, y, iou_threshold=0.85):
         """ 模式颜料桶功能 """
-        fixed_tolerance = 30.0
         if self.image:
-            # 保存当前图像状态，用于撤销
-            self.history.append(self.image.copy())
-            self.redo_stack.clear()  # 清除重做栈
             self.printLog(f"模式颜料桶正在运行中，请暂时不要进行别的操作...", color="red", isBold=True)
             QApplication.processEvents()
 
-            img = self.image.copy()  # 使用副本
-
-            width, height = img.size
-
-            # 创建访问标记数组
-            visited = np.zeros((height, width), dtype=bool)
-
-            # 1. 使用get_flood_mask获取初次填色的区域掩码
-            initial_mask, _ = get_flood_mask(img, x, y, fixed_tolerance)
-
-            # 2. 获取填充区域的边界框
-            top, bottom, left, right = get_bounding_box(initial_mask)
-            mask_height, mask_width = bottom - top + 1, right - left + 1
-            print(f"Initial fill bounding box: {(left, top, right, bottom)}")
-
-            # 3. 使用访问标记数组避免重复枚举
-            for i in range(width - mask_width):
-                for j in range(height - mask_height):
-                    # 跳过已经访问过的位置
-                    if visited[j, i]:
-                        continue
-
-                    # 4. 尝试从当前位置获取填充掩码，并获取新的区域掩码
-                    temp_mask, fill_pixels = get_flood_mask(img, i, j, fixed_tolerance)
-                    visited = np.logical_or(visited, temp_mask)
-
-                    # 5. 计算IOU值
-                    iou = calculate_iou(initial_mask, temp_mask, self.debug)
-                    # print(f"[debug] iou = {iou}") # debug
-                    
-                    # 6. 标记 vis 数组，而且如果IOU大于阈值，则填充该区域
-                    # for dx in range(mask_width):
-                    #     for dy in range(mask_height):
-                    #         # if 0 <= j + dy < height and 0 <= i + dx < width:
-                    #         if temp_mask[j + dy, i + dx] == 1:
-                    #             visited[j + dy, i + dx] = 1
-                    
-                    if iou > iou_threshold:
-                        # ImageDraw.floodfill(
-                        #     img, central_point, self.current_color, thresh=fixed_tolerance
-                        # )
-                        pixels = img.load()
-                        for px, py in fill_pixels:
-                            pixels[px, py] = self.current_color
-                        print(f"发现一处模式匹配，已填色")
-                        self.printLog(f"发现一处模式匹配，已填色: {self.current_color}")
-                        self.printLog(f"模式颜料桶正在运行中，请暂时不要进行别的操作...", color="red", isBold=True)
-                        QApplication.processEvents()
-                        self.image = img
-                        self.display_image()
-            
+            def on_match(_):
+                print(f"发现一处模式匹配，已填色")
+                self.printLog(f"发现一处模式匹配，已填色: {self.current_color}")
+                self.printLog(f"模式颜料桶正在运行中，请暂时不要进行别的操作...", color="red", isBold=True)
+                QApplication.processEvents()
+                self.display_image()
+
+            self.engine.debug = self.debug
+            self.engine.mode_fill(x, y, self.current_color, iou_threshold, self.color_metric, on_match)
+
             print(f"点击位置 ({x}, {y}), 填充颜色: {self.current_color}")
 
             self.printLog(f"模式颜料桶填色成功！当前填充颜色: {self.current_color}", color="green", isBold=True)
 
             # 更新图像并显示
-            self.image = img
             self.display_image()
 
 
@@ -423,4 +649,6 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = ColorFillApp()
     window.show()
+    # 事件循环开始、窗口画出来之后再做剩下的初始化；--startup-profile 会在日志里列出各模块导入耗时
+    QTimer.singleShot(0, lambda: window.finish_startup(profile="--startup-profile" in sys.argv))
     sys.exit(app.exec_())
@@ -6,22 +6,24 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=[],
+    # app.py 通过 startup.lazy_import 按名字延迟导入这些模块，静态分析找不到，需要显式列出
+    hiddenimports=['util', 'region', 'color_metric', 'page_cache', 'pdf_utils', 'project', 'vector_export',
+                   'leak_guard', 'region_table', 'engine', 'dxf_import', 'dxf_render', 'fitz', 'ezdxf'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['tkinter'],
     noarchive=False,
     optimize=0,
 )
 pyz = PYZ(a.pure)
 
+# 使用目录模式（onedir）而不是单文件：单文件每次启动都要先解压到临时目录，冷启动很慢
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='app',
     debug=False,
     bootloader_ignore_signals=False,
@@ -36,3 +38,12 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=True,
+    upx_exclude=[],
+    name='app',
+)
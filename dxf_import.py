@@ -0,0 +1,57 @@
+import numpy as np
+
+from page_cache import file_hash
+
+DEFAULT_DXF_WIDTH = 4000  # 默认栅格化宽度（像素）
+
+
+class DxfRasterizer:
+    """ 把 DXF 栅格化为填色画布
+
+    第一次需要渲染时用 ezdxf Frontend 把整个布局渲染一遍，同时按图层记下每个图元的像素坐标；
+    之后切换图层只按记录重画可见图层的图元，不再遍历 DXF，隐藏图层也不用整页重新渲染。
+    合成结果按 (文件哈希, 布局, 宽度, 可见图层) 存到磁盘缓存，再次打开同一组合时直接读取。
+    """
+
+    def __init__(self, path, width=DEFAULT_DXF_WIDTH, layout_name="Model", cache=None):
+        import ezdxf
+        from dxf_render import Viewport, layout_extents, layer_names
+
+        self.path = path
+        self.width = width
+        self.layout_name = layout_name
+        self.cache = cache
+        self.hash = file_hash(path)
+        self.doc = ezdxf.readfile(path)
+        self.extents = layout_extents(self.doc, layout_name)
+        self.layers = layer_names(self.doc)
+        viewport = Viewport(self.extents, width)
+        self.size = (viewport.width, viewport.height)
+        self.records = None  # 记下的图元 [(图层, 像素坐标, 颜色, 线宽), ...]，第一次渲染时生成
+
+    def _key(self, **params):
+        return self.cache.key(self.hash, self.layout_name, width=self.width, **params)
+
+    def composite(self, visible):
+        """ 可见图层画在白底上的结果，返回 (H, W, 3) 的 uint8 数组 """
+        from dxf_render import draw_records, render_raster
+
+        visible = set(visible)
+        visible = [name for name in self.layers if name in visible]
+        key = self._key(kind="dxf_composite", layers=visible) if self.cache is not None else None
+        if key is not None:
+            cached = self.cache.get_array(key, "rgb")
+            if cached is not None:
+                return np.array(cached)
+
+        if self.records is None:
+            self.records = []
+            result = render_raster(self.doc, self.layout_name, None, self.width, self.extents, records=self.records)
+            if len(visible) < len(self.layers):
+                result = draw_records(self.records, self.size, visible)
+        else:
+            result = draw_records(self.records, self.size, visible)
+
+        if key is not None:
+            self.cache.put_array(key, "rgb", result)
+        return result
@@ -0,0 +1,264 @@
+from abc import abstractmethod
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import ezdxf
+from ezdxf import bbox
+from ezdxf.addons.drawing import Frontend, RenderContext
+from ezdxf.addons.drawing.backend import BackendInterface
+from ezdxf.addons.drawing.config import BackgroundPolicy, Configuration
+
+# 直接遍历 ezdxf Frontend 的输出写 SVG / 栅格，不经过 Matplotlib 的 artist 树。
+# 每个图元在 Frontend 回调时立即写出，内存占用与图元数量无关（RasterBackend 要求记录图元时除外）。
+# 需要 ezdxf >= 1.1 的 BackendInterface。
+
+DEFAULT_WIDTH = 2000  # 默认输出宽度（像素）
+PX_PER_MM = 2.0  # 线宽换算：1 mm 线宽对应的像素数
+MIN_STROKE = 0.5  # 最细线宽（像素）
+
+
+def _parse_color(color):
+    """ ezdxf 的 "#RRGGBB" 或 "#RRGGBBAA" 转为 (r, g, b, a) """
+    color = color.lstrip("#")
+    r, g, b = int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16)
+    a = int(color[6:8], 16) if len(color) >= 8 else 255
+    return r, g, b, a
+
+
+class Viewport:
+    """ 图纸坐标（WCS，y 向上）到输出像素坐标（y 向下）的变换 """
+
+    def __init__(self, extents, width=DEFAULT_WIDTH, margin=10):
+        self.xmin, self.ymin = extents.extmin.x, extents.extmin.y
+        self.xmax, self.ymax = extents.extmax.x, extents.extmax.y
+        size_x = max(self.xmax - self.xmin, 1e-9)
+        size_y = max(self.ymax - self.ymin, 1e-9)
+        self.margin = margin
+        self.scale = (width - 2 * margin) / size_x
+        self.width = int(width)
+        self.height = int(np.ceil(size_y * self.scale)) + 2 * margin
+        # 曲线离散精度：半个像素
+        self.flatten_distance = 0.5 / self.scale
+
+    def points(self, vertices):
+        pts = np.array([(v.x, v.y) for v in vertices], dtype=np.float64).reshape(-1, 2)
+        pts[:, 0] = (pts[:, 0] - self.xmin) * self.scale + self.margin
+        pts[:, 1] = (self.ymax - pts[:, 1]) * self.scale + self.margin
+        return pts
+
+
+class _StreamingBackend(BackendInterface):
+    """ 把 Frontend 的各种绘制调用统一成折线和多边形两种基本操作 """
+
+    def __init__(self, viewport):
+        self.viewport = viewport
+        self.layer = None  # 正在绘制的顶层图元所在的图层，由 render_layout 设置
+
+    @abstractmethod
+    def polyline(self, pts, properties):
+        """ 画一条 (N, 2) 像素坐标的折线 """
+
+    @abstractmethod
+    def polygon(self, polygons, properties):
+        """ 填充若干个 (N, 2) 像素坐标的多边形（even-odd 规则） """
+
+    def configure(self, config):
+        pass
+
+    def enter_entity(self, entity, properties):
+        pass
+
+    def exit_entity(self, entity):
+        pass
+
+    def set_background(self, color):
+        pass
+
+    def draw_point(self, pos, properties):
+        self.polyline(self.viewport.points([pos, pos]), properties)
+
+    def draw_line(self, start, end, properties):
+        self.polyline(self.viewport.points([start, end]), properties)
+
+    def draw_solid_lines(self, lines, properties):
+        for start, end in lines:
+            self.draw_line(start, end, properties)
+
+    def draw_path(self, path, properties):
+        vertices = list(path.flattening(self.viewport.flatten_distance))
+        if len(vertices) > 1:
+            self.polyline(self.viewport.points(vertices), properties)
+
+    def draw_filled_paths(self, paths, properties):
+        polygons = [self.viewport.points(list(path.flattening(self.viewport.flatten_distance))) for path in paths]
+        polygons = [pts for pts in polygons if len(pts) > 2]
+        if polygons:
+            self.polygon(polygons, properties)
+
+    def draw_filled_polygon(self, points, properties):
+        pts = self.viewport.points(points.vertices())
+        if len(pts) > 2:
+            self.polygon([pts], properties)
+
+    def draw_image(self, image_data, properties):
+        # 光栅图像不在线稿渲染范围内
+        pass
+
+    def clear(self):
+        pass
+
+    def finalize(self):
+        pass
+
+
+class SVGStreamBackend(_StreamingBackend):
+    """ 边遍历边把 <path> 写入文本流的 SVG 后端 """
+
+    def __init__(self, stream, viewport, background=(255, 255, 255)):
+        super().__init__(viewport)
+        self.stream = stream
+        stream.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{viewport.width}" height="{viewport.height}" '
+                     f'viewBox="0 0 {viewport.width} {viewport.height}">\n')
+        if background is not None:
+            stream.write(f'<rect width="100%" height="100%" fill="rgb{tuple(background)}"/>\n')
+
+    @staticmethod
+    def _path_data(pts, close):
+        data = "M" + "L".join(f"{x:.2f},{y:.2f}" for x, y in pts)
+        return data + "Z" if close else data
+
+    def polyline(self, pts, properties):
+        r, g, b, a = _parse_color(properties.color)
+        width = max(properties.lineweight * PX_PER_MM, MIN_STROKE)
+        self.stream.write(f'<path d="{self._path_data(pts, False)}" fill="none" stroke="rgb({r},{g},{b})" '
+                          f'stroke-opacity="{a / 255:.3f}" stroke-width="{width:.2f}"/>\n')
+
+    def polygon(self, polygons, properties):
+        r, g, b, a = _parse_color(properties.color)
+        data = "".join(self._path_data(pts, True) for pts in polygons)
+        self.stream.write(f'<path d="{data}" fill="rgb({r},{g},{b})" fill-opacity="{a / 255:.3f}" '
+                          f'fill-rule="evenodd" stroke="none"/>\n')
+
+    def finalize(self):
+        self.stream.write("</svg>\n")
+
+
+class RasterBackend(_StreamingBackend):
+    """ 直接画到 PIL 图像上，结束后以 NumPy 数组返回；background 为 None 时输出透明背景的 RGBA
+
+    给出列表 records 时同时记下每个图元 (图层, 像素坐标, 颜色, 线宽)，线宽为 None 表示填充多边形，
+    之后可以用 draw_records 只按图层重画，不需要再经过 Frontend。
+    """
+
+    def __init__(self, viewport, background=(255, 255, 255), records=None):
+        super().__init__(viewport)
+        if background is None:
+            self.image = Image.new("RGBA", (viewport.width, viewport.height), (0, 0, 0, 0))
+        else:
+            self.image = Image.new("RGB", (viewport.width, viewport.height), tuple(background))
+        self.draw = ImageDraw.Draw(self.image)
+        self.records = records
+
+    def polyline(self, pts, properties):
+        width = max(int(round(properties.lineweight * PX_PER_MM)), 1)
+        color = _parse_color(properties.color)
+        _draw_record(self.draw, pts, color, width)
+        if self.records is not None:
+            self.records.append((self.layer, pts, color, width))
+
+    def polygon(self, polygons, properties):
+        color = _parse_color(properties.color)
+        for pts in polygons:
+            _draw_record(self.draw, pts, color, None)
+            if self.records is not None:
+                self.records.append((self.layer, pts, color, None))
+
+    def array(self):
+        return np.asarray(self.image)
+
+
+def _draw_record(draw, pts, color, width):
+    if width is None:
+        draw.polygon([tuple(p) for p in pts.tolist()], fill=color)
+    else:
+        draw.line([tuple(p) for p in pts.tolist()], fill=color, width=width)
+
+
+def draw_records(records, size, layers=None, background=(255, 255, 255)):
+    """ 按 RasterBackend 记下的图元重画 (W, H) 大小的栅格，layers 不为 None 时只画这些图层
+
+    图元按原来的绘制顺序重画，结果与只渲染这些图层相同。background 的含义同 render_raster。
+    """
+    if background is None:
+        image = Image.new("RGBA", size, (0, 0, 0, 0))
+    else:
+        image = Image.new("RGB", size, tuple(background))
+    draw = ImageDraw.Draw(image)
+    layers = set(layers) if layers is not None else None
+    for layer, pts, color, width in records:
+        if layers is None or layer in layers:
+            _draw_record(draw, pts, color, width)
+    return np.asarray(image)
+
+
+def _load(doc_or_path):
+    return ezdxf.readfile(doc_or_path) if isinstance(doc_or_path, str) else doc_or_path
+
+
+def layout_extents(doc, layout_name="Model"):
+    """ 整个布局的范围，分图层渲染时所有图层共用，保证图层之间对齐 """
+    return bbox.extents(doc.layouts.get(layout_name), fast=True)
+
+
+def render_layout(doc, backend, layout_name="Model", layers=None):
+    """ 用给定后端渲染一个布局，layers 不为空时只渲染这些图层 """
+    layout = doc.layouts.get(layout_name)
+    config = Configuration(background_policy=BackgroundPolicy.WHITE)
+    frontend = Frontend(RenderContext(doc), backend, config)
+    layers = set(layers) if layers is not None else None
+
+    def filter_func(entity):
+        layer = entity.dxf.get("layer", "0")
+        if layers is not None and layer not in layers:
+            return False
+        # Frontend 对每个顶层图元先调用过滤函数再绘制，块引用里的图元也算作引用所在的图层
+        backend.layer = layer
+        return True
+
+    frontend.draw_layout(layout, finalize=True, filter_func=filter_func)
+
+
+def render_svg(doc_or_path, stream, layout_name="Model", layers=None, width=DEFAULT_WIDTH, extents=None):
+    """ 把 DXF 渲染为 SVG 写入文本流 """
+    doc = _load(doc_or_path)
+    viewport = Viewport(extents or layout_extents(doc, layout_name), width)
+    render_layout(doc, SVGStreamBackend(stream, viewport), layout_name, layers)
+
+
+def render_raster(doc_or_path, layout_name="Model", layers=None, width=DEFAULT_WIDTH, extents=None,
+                  background=(255, 255, 255), records=None):
+    """ 把 DXF 渲染为 (H, W, 3) 的 uint8 数组；background 为 None 时返回透明背景的 (H, W, 4)
+
+    给出列表 records 时把绘制的图元追加进去，见 draw_records。
+    """
+    doc = _load(doc_or_path)
+    viewport = Viewport(extents or layout_extents(doc, layout_name), width)
+    backend = RasterBackend(viewport, background, records)
+    render_layout(doc, backend, layout_name, layers)
+    return backend.array()
+
+
+def layer_names(doc):
+    return [layer.dxf.name for layer in doc.layers]
+
+
+def layout_names(doc):
+    return list(doc.layouts.names())
+
+
+def render_each_layer(doc_or_path, layout_name="Model", width=DEFAULT_WIDTH, background=None):
+    """ 逐个图层单独渲染，返回 {图层名: 数组}，所有图层使用相同的范围和尺寸 """
+    doc = _load(doc_or_path)
+    extents = layout_extents(doc, layout_name)
+    return {name: render_raster(doc, layout_name, [name], width, extents, background) for name in layer_names(doc)}
@@ -1,17 +1,56 @@
+import argparse
+import io
 import os
-import matplotlib.pyplot as plt
-import ezdxf
-from ezdxf.addons.drawing import RenderContext, Frontend
-from ezdxf.addons.drawing.matplotlib import MatplotlibBackend
+import tempfile
+import time
+from multiprocessing import Pool
+
+from dxf_render import render_svg
 from svglib.svglib import svg2rlg
 from reportlab.graphics import renderPM
 from pptx import Presentation
 from pptx.util import Inches
 
+# renderPM 只能输出位图格式，并不支持 EMF
+PICTURE_FORMATS = ("PNG", "GIF", "TIFF", "BMP", "JPG")
+
+def render_dxf_to_svg_bytes(dxf_path):
+    """
+    Renders a DXF file to SVG in memory with the streaming backend.
+
+    :param dxf_path: Path to the input DXF file.
+    :return: SVG document as bytes.
+    """
+    buffer = io.StringIO()
+    render_svg(dxf_path, buffer)
+    return buffer.getvalue().encode("utf-8")
+
+
+def svg_bytes_to_image_bytes(svg_bytes, fmt="PNG"):
+    """
+    Converts an in-memory SVG document with svglib and reportlab.
+
+    :param svg_bytes: SVG document as bytes.
+    :param fmt: Raster format written by renderPM, one of PICTURE_FORMATS.
+    :return: Converted image as bytes.
+    """
+    try:
+        drawing = svg2rlg(io.BytesIO(svg_bytes))
+    except (TypeError, AttributeError):
+        # 旧版本 svglib 只接受文件路径
+        with tempfile.NamedTemporaryFile(suffix=".svg", delete=False) as f:
+            f.write(svg_bytes)
+        try:
+            drawing = svg2rlg(f.name)
+        finally:
+            os.remove(f.name)
+    return renderPM.drawToString(drawing, fmt=fmt)
+
+
 def convert_dxf_to_svg(dxf_path, svg_path):
     """
-    Converts a DXF file to an SVG file using Matplotlib and ezdxf.
-    
+    Converts a DXF file to an SVG file using ezdxf and the streaming SVG backend.
+
     :param dxf_path: Path to the input DXF file.
     :param svg_path: Path to save the output SVG file.
     """
@@ -19,18 +58,11 @@ def convert_dxf_to_svg(dxf_path, svg_path):
         # Ensure output folder exists
         os.makedirs(os.path.dirname(svg_path), exist_ok=True)
 
-        # Load the DXF file
-        doc = ezdxf.readfile(dxf_path)
-
-        # Create a figure and backend for Matplotlib
-        fig = plt.figure()
-        out = MatplotlibBackend(fig.add_axes([0, 0, 1, 1]))
-
-        # Render the DXF to the Matplotlib backend
-        Frontend(RenderContext(doc), out).draw_layout(doc.modelspace(), finalize=True)
+        svg_bytes = render_dxf_to_svg_bytes(dxf_path)
 
         # Save the result as an SVG
-        fig.savefig(svg_path, format="svg")
+        with open(svg_path, "wb") as f:
+            f.write(svg_bytes)
         print(f"DXF successfully converted to SVG and saved at {svg_path}")
     except Exception as e:
         print(f"Error during DXF to SVG conversion: {e}")
@@ -39,61 +71,102 @@ def convert_dxf_to_svg(dxf_path, svg_path):
             f.write("<svg xmlns='http://www.w3.org/2000/svg' width='100' height='100'></svg>")
         print(f"Fallback: Created empty SVG file at {svg_path}")
 
-def convert_svg_to_emf(svg_path, emf_path):
+def add_picture_slide(prs, picture):
     """
-    Converts an SVG file to EMF format using svglib and reportlab.
-    
-    :param svg_path: Path to the input SVG file.
-    :param emf_path: Path to save the output EMF file.
+    Appends a blank slide holding one picture.
+
+    :param prs: The Presentation to extend.
+    :param picture: Path or file-like object of the picture.
     """
+    slide_layout = prs.slide_layouts[5]  # Blank slide
+    slide = prs.slides.add_slide(slide_layout)
+    slide.shapes.add_picture(picture, Inches(1), Inches(1), Inches(5), Inches(5))
+
+
+def _convert_worker(task):
+    """ 进程池中执行的前两个阶段：DXF -> SVG -> 图片，中间结果只在内存里传递 """
+    dxf_path, fmt, keep_dir = task
+    timings = {}
     try:
-        # Ensure file exists before attempting conversion
-        if not os.path.exists(svg_path):
-            print(f"SVG file {svg_path} does not exist.")
-            return
-        
-        # Load SVG file
-        drawing = svg2rlg(svg_path)
-
-        # Convert to EMF and save
-        renderPM.drawToFile(drawing, emf_path, fmt="EMF")
-        print(f"SVG successfully converted to EMF and saved at {emf_path}")
+        start = time.perf_counter()
+        svg_bytes = render_dxf_to_svg_bytes(dxf_path)
+        timings["dxf->svg"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        image_bytes = svg_bytes_to_image_bytes(svg_bytes, fmt)
+        timings["svg->" + fmt.lower()] = time.perf_counter() - start
     except Exception as e:
-        print(f"Error during SVG to EMF conversion: {e}")
+        return dxf_path, None, timings, str(e)
+
+    if keep_dir:
+        base = os.path.join(keep_dir, os.path.splitext(os.path.basename(dxf_path))[0])
+        with open(base + ".svg", "wb") as f:
+            f.write(svg_bytes)
+        with open(base + "." + fmt.lower(), "wb") as f:
+            f.write(image_bytes)
+    return dxf_path, image_bytes, timings, None
 
-def add_emf_to_pptx(emf_path, pptx_path):
+
+def convert_many(dxf_paths, pptx_path, fmt="PNG", workers=None, keep_dir=None):
     """
-    Adds an EMF file to a PowerPoint presentation.
-    
-    :param emf_path: Path to the input EMF file.
-    :param pptx_path: Path to save the output PowerPoint file.
+    Converts many DXF files into one presentation, one slide per drawing.
+
+    Rendering and conversion run in a process pool; results stream back in
+    input order and are added to the presentation as soon as they arrive.
+
+    :return: Dict mapping stage name to (files, seconds).
     """
-    try:
-        # Create a PowerPoint presentation
-        prs = Presentation()
-        slide_layout = prs.slide_layouts[5]  # Blank slide
-        slide = prs.slides.add_slide(slide_layout)
+    if keep_dir:
+        os.makedirs(keep_dir, exist_ok=True)
 
-        # Add EMF image to the slide
-        slide.shapes.add_picture(emf_path, Inches(1), Inches(1), Inches(5), Inches(5))
+    prs = Presentation()
+    stats = {}
+    tasks = [(path, fmt, keep_dir) for path in dxf_paths]
+    with Pool(workers) as pool:
+        for dxf_path, image_bytes, timings, error in pool.imap(_convert_worker, tasks):
+            for stage, seconds in timings.items():
+                count, total = stats.get(stage, (0, 0.0))
+                stats[stage] = (count + 1, total + seconds)
+            if error is not None:
+                print(f"Error converting {dxf_path}: {error}")
+                continue
+
+            start = time.perf_counter()
+            add_picture_slide(prs, io.BytesIO(image_bytes))
+            count, total = stats.get("pptx", (0, 0.0))
+            stats["pptx"] = (count + 1, total + time.perf_counter() - start)
+            print(f"Added {dxf_path}")
+
+    start = time.perf_counter()
+    prs.save(pptx_path)
+    stats["save"] = (1, time.perf_counter() - start)
+    return stats
+
+
+def print_stats(stats, wall):
+    """ 打印每个阶段的吞吐量 """
+    print(f"{'stage':<12}{'files':>8}{'seconds':>10}{'files/s':>10}")
+    for stage, (count, seconds) in stats.items():
+        rate = count / seconds if seconds > 0 else float("inf")
+        print(f"{stage:<12}{count:>8}{seconds:>10.2f}{rate:>10.2f}")
+    print(f"wall time: {wall:.2f}s")
 
-        # Save the presentation
-        prs.save(pptx_path)
-        print(f"EMF successfully inserted into PowerPoint and saved at {pptx_path}")
-    except Exception as e:
-        print(f"Error during PowerPoint creation: {e}")
 
-# File paths
-dxf_file = "./test/sample_dxf.dxf"  # Replace with your DXF file path
-svg_file = "./test/sample_dxf.svg"  # Replace with your desired SVG output path
-emf_file = "./test/sample_dxf.emf"  # Replace with your desired EMF output path
-pptx_file = "./test/sample_dxf.pptx"  # Replace with your desired PowerPoint output path
+def main():
+    parser = argparse.ArgumentParser(description="Convert DXF drawings into one PowerPoint presentation")
+    parser.add_argument("dxf", nargs="+", help="input DXF files")
+    parser.add_argument("-o", "--output", default="drawings.pptx", help="output PowerPoint file")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("-f", "--format", default="PNG", type=str.upper, choices=PICTURE_FORMATS,
+                        help="raster picture format produced by renderPM")
+    parser.add_argument("--keep", default=None, help="also write SVG and picture intermediates to this folder")
+    args = parser.parse_args()
 
-# Convert DXF to SVG
-convert_dxf_to_svg(dxf_file, svg_file)
+    start = time.perf_counter()
+    stats = convert_many(args.dxf, args.output, args.format, args.jobs, args.keep)
+    print(f"Saved {args.output}")
+    print_stats(stats, time.perf_counter() - start)
 
-# Convert SVG to EMF
-convert_svg_to_emf(svg_file, emf_file)
 
-# Add EMF to PowerPoint
-add_emf_to_pptx(emf_file, pptx_file)
+if __name__ == "__main__":
+    main()
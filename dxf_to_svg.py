@@ -1,13 +1,28 @@
 #!/usr/bin/env python3
-import matplotlib.pyplot as plt
-import ezdxf 
-from ezdxf.addons.drawing import RenderContext, Frontend 
-from ezdxf.addons.drawing.matplotlib import MatplotlibBackend
+import ezdxf
+from dxf_render import render_svg, layer_names
 import os
+import re
+
+
+def safe_filename(name):
+    """ 图层名里可能有 / 等不能用在文件名里的字符，替换成下划线 """
+    name = re.sub(r'[\\/:*?"<>|\x00-\x1f]', "_", name).strip(" .")
+    return name or "_"
+
 
 doc = ezdxf.readfile('./test/sample_dxf.dxf')
-fig = plt.figure()
-out = MatplotlibBackend(fig.add_axes([0, 0, 1, 1]))
-Frontend(RenderContext(doc), out).draw_layout(doc.modelspace(), finalize=True)
-#fig.savefig(os.path.join(temp_output_dir, outputfilebase + ".png"), dpi=300)
-fig.savefig(os.path.join('./test', 'sample_dxf' + ".svg")) 
\ No newline at end of file
+with open(os.path.join('./test', 'sample_dxf' + ".svg"), "w", encoding="utf-8") as f:
+    render_svg(doc, f)
+
+# 每个图层单独输出一份 SVG
+layer_dir = os.path.join('./test', 'sample_dxf_layers')
+os.makedirs(layer_dir, exist_ok=True)
+used = set()
+for name in layer_names(doc):
+    filename = safe_filename(name)
+    while filename.lower() in used:  # 不同图层替换后可能重名
+        filename += "_"
+    used.add(filename.lower())
+    with open(os.path.join(layer_dir, filename + ".svg"), "w", encoding="utf-8") as f:
+        render_svg(doc, f, layers=[name])
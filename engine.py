@@ -0,0 +1,357 @@
+import argparse
+import json
+import time
+
+import numpy as np
+from PIL import Image
+
+import color_metric
+import leak_guard
+import pdf_utils
+import project
+import util
+from page_cache import PageCache
+from region import Region
+from region_table import RegionTable
+from working_image import WorkingImage, scratch_array
+
+LOG_VERSION = 1
+DEFAULT_COLOR = (255, 0, 0)
+DEFAULT_TOLERANCE = 36
+MODE_TOLERANCE = 30.0  # 模式颜料桶使用的固定容差
+DEFAULT_IOU_THRESHOLD = 0.85
+
+
+class FillEngine:
+    """ 与界面无关的填色引擎：打开文件、填色、模式填色、撤销/重做、保存都是普通的 Python 调用
+
+    每个操作连同解析后的完整参数和耗时记录在 oplog 中，写成 JSON Lines 之后可以用 replay 无界面重放，
+    重现同样的结果并得到每个操作的耗时，用于在版本之间对比性能。
+    """
+
+    def __init__(self, cache=None, mapped=False):
+        self.image = None
+        self.history = []  # 撤销栈，元素为 Delta（只保存变化区域的像素块）
+        self.redo_stack = []
+        self.project = None  # 当前工程，记录源文件和编辑日志
+        self.regions = RegionTable()  # 填色区域表，随填色和撤销/重做增量更新
+        self.mapped = mapped  # 大图模式：工作图像放在内存映射文件中
+        self.debug = False
+        self.oplog = []  # 操作日志，每项为 {"op", "args", "seconds", "result"}
+        self._cache = cache
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = PageCache()
+        return self._cache
+
+    def _record(self, op, args, start, **result):
+        entry = {"op": op, "args": args, "seconds": round(time.perf_counter() - start, 6), "result": result}
+        self.oplog.append(entry)
+        return entry
+
+    def _reset(self, pixels):
+        """ 用 (H, W, 3) 数组创建新的工作图像并清空撤销栈；大图模式下按块拷贝到内存映射文件 """
+        if self.image is not None:
+            self.image.close()
+        self.image = WorkingImage.from_array(pixels, mapped=self.mapped)
+        self.history.clear()
+        self.redo_stack.clear()
+        self.regions.clear()
+
+    def load_source(self, source):
+        """ 按工程里记录的源文件引用重新载入原图，返回 (H, W, 3) 数组 """
+        if source["path"].lower().endswith(".dxf"):
+            import dxf_import
+            rasterizer = dxf_import.DxfRasterizer(source["path"], source["width"], source["page"], cache=self.cache)
+            return rasterizer.composite(source["layers"] if source.get("layers") is not None else rasterizer.layers)
+        if source["path"].lower().endswith(".pdf"):
+            return pdf_utils.render_page_array(source["path"], source["page"], source["zoom"], cache=self.cache)
+        return np.asarray(Image.open(source["path"]).convert("RGB"))
+
+    def open(self, path, page=0, dxf_width=None, layers=None, pixels=None):
+        """ 打开 PDF、DXF 或图片，新建工程
+
+        PDF 按 RENDER_ZOOM 渲染第 page 页；DXF 的 page 为布局名，按 dxf_width 宽度栅格化 layers 图层。
+        pixels 为界面在后台线程里已经渲染好的像素，给出时不再重复渲染（日志里不记录像素）。
+        """
+        start = time.perf_counter()
+        args = {"path": path, "page": page}
+        self.project = project.Project()
+        if path.lower().endswith(".dxf"):
+            import dxf_import
+            args.update(dxf_width=dxf_width or dxf_import.DEFAULT_DXF_WIDTH, layers=layers)
+            self.project.set_source(path, page or "Model", None, width=args["dxf_width"], layers=layers)
+        elif path.lower().endswith(".pdf"):
+            self.project.set_source(path, page, pdf_utils.RENDER_ZOOM)
+        else:
+            self.project.set_source(path)
+        self._reset(self.load_source(self.project.source) if pixels is None else pixels)
+        width, height = self.image.size
+        self._record("open", args, start, size=[width, height])
+
+    def open_project(self, path):
+        """ 打开工程文件，在原图上重建编辑结果，撤销/重做的像素块按需加载 """
+        start = time.perf_counter()
+        opened = project.Project.open(path)
+        if opened.source is None or opened.source_changed():
+            raise ValueError("工程引用的源文件不存在或已被修改")
+
+        state = opened.page_state(opened.source["page"])
+        self._reset(self.load_source(opened.source))
+        opened.restore(self.image, opened.source["page"])
+        self.history = list(state["history"])
+        self.redo_stack = list(state["redo"])
+        self.regions.rebuild(self.history, self.redo_stack)
+        self.project = opened
+        self._record("open_project", {"path": path}, start, edits=len(self.history))
+
+    def _push_edit(self, delta, regions, color):
+        """ 把一次编辑的差异块压入撤销栈并写入工程日志，同时把填色区域加入区域表 """
+        if not delta.tiles:
+            return
+        self.history.append(delta)
+        self.redo_stack.clear()  # 清除重做栈
+        self.regions.push(list(regions), color)
+        if self.project is not None:
+            self.project.record_edit(delta, self.project.source["page"])
+
+    def fill(self, x, y, color=DEFAULT_COLOR, tolerance=DEFAULT_TOLERANCE, metric=color_metric.DEFAULT_METRIC,
+             leak_gap=0):
+        """ 普通颜料桶：从 (x, y) 填色，返回填充的像素数
+
+        leak_gap 大于 0 时开启防漏填充，超出预算时抛出 util.FillBudgetExceeded（图像不变）。
+        """
+        start = time.perf_counter()
+        args = {"x": x, "y": y, "color": list(color), "tolerance": tolerance, "metric": metric, "leak_gap": leak_gap}
+        img = self.image  # 原地修改，撤销只保存改动区域
+        target_color = img.getpixel((x, y))
+
+        # 按颜色度量计算填充区域，再按块一次性上色，最后按覆盖率混合抗锯齿边缘
+        guard = {}
+        if leak_gap:
+            # 屏障掩码按页缓存；图片还是原图时同时存到磁盘缓存
+            source = self.project.source if self.project is not None and not self.history else None
+            guard["barrier"] = leak_guard.barrier_mask(img, leak_gap, source, self.cache)
+            guard["max_area"], guard["max_extent"] = leak_guard.fill_budget(img)
+        try:
+            rows, starts, ends = util.get_flood_spans(img, x, y, tolerance, metric, **guard)
+        except util.FillBudgetExceeded as e:
+            self._record("fill", args, start, aborted=str(e))
+            raise
+        filled = Region(rows, starts, ends)
+        previous = self.regions.region_at(x, y, target_color)
+        if previous is not None:
+            # 在已经填过色的区域上再次填色：只重涂原来的区域。外侧边缘已经混合了原填充色，
+            # 会被当成相似颜色并进来，每填一次就向线条里扩一圈；以原填充色为背景重新混合边缘即可换色
+            filled = filled.intersect(*previous)
+            rows, starts, ends = filled.rows, filled.starts, filled.ends
+        delta = project.Delta({"op": "fill", "x": x, "y": y, "color": list(color),
+                               "tolerance": tolerance, "metric": metric}, compress=img.mapped)
+        bbox = util.spans_bbox(rows, starts, ends, util.EDGE_WIDTH, img.arr.shape)
+        delta.capture(img, bbox)
+        util.paint_spans(img.arr, rows, starts, ends, color)
+        util.blend_edges(img.arr, rows, starts, ends, color, target_color, metric=metric)
+        color_metric.invalidate_color_index(img, bbox)  # 只丢弃改动的那几行的量化缓存
+
+        # 保存差异块，用于撤销
+        self._push_edit(delta.finish(img), [filled], color)
+        self._record("fill", args, start, area=filled.area, bbox=list(filled.bbox))
+        return filled.area
+
+    def mode_fill(self, x, y, color=DEFAULT_COLOR, iou_threshold=DEFAULT_IOU_THRESHOLD,
+                  metric=color_metric.DEFAULT_METRIC, on_match=None):
+        """ 模式颜料桶：找出与 (x, y) 处区域形状相同（IoU 超过阈值）的所有区域并填色，返回匹配个数
+
+        每填一处调用一次 on_match(region)，界面用它刷新显示。
+        """
+        start = time.perf_counter()
+        args = {"x": x, "y": y, "color": list(color), "iou_threshold": iou_threshold, "metric": metric}
+        img = self.image  # 原地修改，撤销只保存每处匹配区域的像素块
+        delta = project.Delta({"op": "mode_fill", "x": x, "y": y, "color": list(color),
+                               "iou_threshold": iou_threshold, "metric": metric}, compress=img.mapped)
+
+        width, height = img.size
+        matched = []  # 匹配并填色的区域，记入区域表
+
+        # 创建访问标记数组（大图模式下放在内存映射文件里）
+        visited = scratch_array((height, width), bool, img.mapped)
+
+        # 1. 获取初次填色的区域（按行区间 + 边界框表示，不再生成整页掩码）
+        initial = Region.flood(img, x, y, MODE_TOLERANCE, metric)
+
+        # 2. 获取填充区域的边界框
+        mask_height, mask_width = initial.height, initial.width
+
+        # 3. 使用访问标记数组避免重复枚举
+        for i in range(width - mask_width):
+            # 每一列先用 NumPy 找出还没访问过的位置，跳过已访问的像素不再进入 Python 循环
+            for j in np.flatnonzero(~visited[:height - mask_height, i]).tolist():
+                # 跳过本列中途被新区域覆盖的位置
+                if visited[j, i]:
+                    continue
+
+                # 4. 尝试从当前位置填充，得到新的区域，只在它的边界框内更新访问标记
+                temp = Region.flood(img, i, j, MODE_TOLERANCE, metric)
+                temp.mark(visited)
+
+                # 5. 计算IOU值（在行区间上合并计算，确定达不到阈值时提前结束）
+                iou = initial.iou(temp, iou_threshold)
+                if self.debug:
+                    util.calculate_iou(initial.page_mask((height, width)), temp.page_mask((height, width)), True)
+
+                # 6. 如果IOU大于阈值，则填充该区域
+                if iou > iou_threshold:
+                    background = tuple(int(c) for c in img.arr[j, i])  # 上色前的种子颜色，用于边缘混合
+                    bbox = temp.edge_bbox(img.arr.shape)
+                    delta.capture(img, bbox)
+                    temp.apply_color(img.arr, color, background, metric=metric, visited=visited)
+                    matched.append(temp)
+                    color_metric.invalidate_color_index(img, bbox)  # 像素被原地修改，这几行的颜色索引需要重建
+                    if on_match is not None:
+                        on_match(temp)
+
+        # 保存差异块，用于撤销
+        self._push_edit(delta.finish(img), matched, color)
+        self._record("mode_fill", args, start, matches=len(matched), area=sum(r.area for r in matched))
+        return len(matched)
+
+    def undo(self):
+        start = time.perf_counter()
+        if not self.history:
+            self._record("undo", {}, start, applied=False)  # 没有可撤销的编辑也记一条，重放时一一对应
+            return False
+        delta = self.history.pop()
+        delta.revert(self.image)
+        for bbox in delta.bboxes:
+            color_metric.invalidate_color_index(self.image, bbox)
+        self.regions.undo()
+        self.redo_stack.append(delta)
+        if self.project is not None:
+            self.project.record_undo(self.project.source["page"])
+        self._record("undo", {}, start)
+        return True
+
+    def redo(self):
+        start = time.perf_counter()
+        if not self.redo_stack:
+            self._record("redo", {}, start, applied=False)  # 没有可重做的编辑也记一条，重放时一一对应
+            return False
+        delta = self.redo_stack.pop()
+        delta.apply(self.image)
+        for bbox in delta.bboxes:
+            color_metric.invalidate_color_index(self.image, bbox)
+        self.regions.redo()
+        self.history.append(delta)
+        if self.project is not None:
+            self.project.record_redo(self.project.source["page"])
+        self._record("redo", {}, start)
+        return True
+
+    def save(self, path=None):
+        """ 保存工程：只把上次保存之后的新编辑追加到工程文件 """
+        start = time.perf_counter()
+        self.project.save(path)
+        self._record("save", {"path": self.project.path}, start)
+
+    def export_image(self, path):
+        start = time.perf_counter()
+        self.image.save(path)
+        self._record("export_image", {"path": path}, start)
+
+    def write_log(self, path):
+        """ 把操作日志写成 JSON Lines，第一行是版本号 """
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"version": LOG_VERSION}) + "\n")
+            for entry in self.oplog:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def read_log(path):
+    with open(path, encoding="utf-8") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("version") != LOG_VERSION:
+        raise ValueError(f"不支持的操作日志: {path}")
+    return lines[1:]
+
+
+REPLAY_OPS = ("open", "open_project", "fill", "mode_fill", "undo", "redo", "save", "export_image")
+
+
+def replay(entries, engine=None, write=False):
+    """ 无界面重放操作日志，返回 (engine, [(记录, 本次耗时, 结果是否一致), ...])
+
+    重放时没有产生记录的操作耗时为 None，结果记为不一致。
+    write=False 时跳过 save 和 export_image，不覆盖原来的文件。
+    """
+    engine = engine or FillEngine()
+    timings = []
+    for entry in entries:
+        op = entry["op"]
+        if op not in REPLAY_OPS or (not write and op in ("save", "export_image")):
+            continue
+        count = len(engine.oplog)
+        try:
+            getattr(engine, op)(**entry["args"])
+        except util.FillBudgetExceeded:
+            pass  # 记录里同样是被取消的填充，结果在下面比较
+        if len(engine.oplog) == count:
+            # 这次调用没有产生记录，不能把上一条操作的耗时和结果算到它头上
+            timings.append((entry, None, False))
+            continue
+        replayed = engine.oplog[-1]
+        timings.append((entry, replayed["seconds"], replayed["result"] == entry.get("result")))
+    return engine, timings
+
+
+def latency_profile(timings):
+    """ 按操作类型汇总耗时：次数、记录的总耗时、重放的总耗时、中位数、p95 和最大值（秒） """
+    by_op = {}
+    for entry, seconds, _ in timings:
+        if seconds is None:
+            continue
+        by_op.setdefault(entry["op"], ([], []))
+        by_op[entry["op"]][0].append(entry["seconds"])
+        by_op[entry["op"]][1].append(seconds)
+    profile = {}
+    for op, (recorded, replayed) in by_op.items():
+        replayed = np.array(replayed)
+        profile[op] = {"count": len(replayed), "recorded": round(sum(recorded), 6), "total": round(float(replayed.sum()), 6),
+                       "p50": round(float(np.percentile(replayed, 50)), 6),
+                       "p95": round(float(np.percentile(replayed, 95)), 6), "max": round(float(replayed.max()), 6)}
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded Archmark session headless and profile each operation")
+    parser.add_argument("log", help="session log written by FillEngine.write_log (.jsonl)")
+    parser.add_argument("-o", "--output", default=None, help="save the final image to this file")
+    parser.add_argument("--profile", default=None, help="write the per-operation latency profile as JSON")
+    parser.add_argument("--write", action="store_true", help="also replay save/export operations")
+    parser.add_argument("--mmap", action="store_true", help="keep the working image in a memory-mapped file")
+    args = parser.parse_args()
+
+    engine, timings = replay(read_log(args.log), FillEngine(mapped=args.mmap), args.write)
+
+    print(f"{'#':>4}  {'op':<14}{'recorded':>10}{'replayed':>10}  result")
+    for index, (entry, seconds, same) in enumerate(timings):
+        replayed = f"{seconds:>10.3f}" if seconds is not None else f"{'-':>10}"
+        print(f"{index:>4}  {entry['op']:<14}{entry['seconds']:>10.3f}{replayed}  {'same' if same else 'DIFFERENT'}")
+    profile = latency_profile(timings)
+    print(f"{'op':<14}{'count':>6}{'recorded':>10}{'total':>10}{'p50':>10}{'p95':>10}{'max':>10}")
+    for op, stats in profile.items():
+        print(f"{op:<14}{stats['count']:>6}{stats['recorded']:>10.3f}{stats['total']:>10.3f}"
+              f"{stats['p50']:>10.3f}{stats['p95']:>10.3f}{stats['max']:>10.3f}")
+    mismatches = sum(1 for _, _, same in timings if not same)
+    print(f"{len(timings)} operations replayed, {mismatches} with different results")
+
+    if args.profile:
+        with open(args.profile, "w", encoding="utf-8") as f:
+            json.dump(profile, f, indent=2)
+    if args.output and engine.image is not None:
+        engine.image.save(args.output)
+
+
+if __name__ == "__main__":
+    main()
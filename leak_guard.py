@@ -0,0 +1,101 @@
+import weakref
+
+import numpy as np
+
+from color_metric import image_array, rgb_to_luma
+from working_image import scratch_array
+
+INK_LUMA = 160  # 亮度低于此值的像素视为线条
+DEFAULT_GAP = 6  # 默认能封住的最大缺口宽度（像素）
+MAX_AREA_RATIO = 0.25  # 开启防漏时，单次填充面积超过整页的这个比例就取消
+MAX_EXTENT_RATIO = 0.9  # 开启防漏时，填充区域的宽或高超过整页的这个比例就取消
+TILE = 512  # 按行分块处理时每块的行数
+
+_barrier_cache = {}
+
+
+def ink_mask(arr, threshold=INK_LUMA, out=None):
+    """ 线条掩码：亮度低于 threshold 的像素，按行分块计算；out 可以是内存映射数组 """
+    arr = image_array(arr)
+    mask = np.empty(arr.shape[:2], dtype=bool) if out is None else out
+    for top in range(0, arr.shape[0], TILE):
+        mask[top:top + TILE] = rgb_to_luma(arr[top:top + TILE]) < threshold
+    return mask
+
+
+def _box_any(mask, radius):
+    """ 每个像素 (2r+1) x (2r+1) 的方形邻域内是否有 True，用积分图（两次 cumsum）计算，耗时与半径无关 """
+    h, w = mask.shape
+    table = np.zeros((h + 1, w + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(mask, axis=0, dtype=np.int32), axis=1, out=table[1:, 1:])
+    y0 = np.clip(np.arange(h) - radius, 0, h)
+    y1 = np.clip(np.arange(h) + radius + 1, 0, h)
+    x0 = np.clip(np.arange(w) - radius, 0, w)
+    x1 = np.clip(np.arange(w) + radius + 1, 0, w)
+    total = table[y1][:, x1] - table[y0][:, x1] - table[y1][:, x0] + table[y0][:, x0]
+    return total > 0
+
+
+def close_gaps(ink, gap, out=None):
+    """ 对线条掩码做闭运算（先膨胀再腐蚀），封住宽度不超过 gap 像素的缺口
+
+    按行分块处理，每块上下多取 2r 行，结果与整页一次计算相同；out 可以是内存映射数组。
+    """
+    radius = (gap + 1) // 2
+    height = ink.shape[0]
+    if out is None:
+        out = np.empty(ink.shape, dtype=bool)
+    if radius == 0:
+        out[:] = ink
+        return out
+    halo = 2 * radius
+    for top in range(0, height, TILE):
+        lo, hi = max(top - halo, 0), min(top + TILE + halo, height)
+        dilated = _box_any(ink[lo:hi], radius)
+        closed = ~_box_any(~dilated, radius)
+        out[top:top + TILE] = closed[top - lo:top - lo + TILE]
+    return out
+
+
+def _cache_key(cache, source, gap):
+    params = {k: v for k, v in source.items() if k not in ("type", "path", "hash", "page")}
+    return cache.key(source["hash"], source["page"], kind="leak_guard", gap=gap, ink=INK_LUMA, **params)
+
+
+def barrier_mask(img, gap=DEFAULT_GAP, source=None, cache=None):
+    """ 获取封住缺口之后的线条掩码，填充时不能越过这些像素
+
+    按图片对象在内存中缓存；给出工程的源文件引用 source 和 PageCache 时还会存到磁盘，
+    下次打开同一页直接以内存映射读取。只有图片还是原图（没有填色）时才应该传 source。
+    """
+    key = (id(img), gap)
+    entry = _barrier_cache.get(key)
+    if entry is not None and entry[0]() is img:
+        return entry[1]
+
+    barrier = None
+    disk_key = None
+    if cache is not None and source is not None:
+        disk_key = _cache_key(cache, source, gap)
+        barrier = cache.get_array(disk_key, "barrier")
+    if barrier is None:
+        # 大图模式下线条掩码和屏障都放在内存映射文件里
+        mapped = getattr(img, "mapped", False)
+        width, height = img.size
+        ink = ink_mask(img, out=scratch_array((height, width), bool, mapped))
+        barrier = close_gaps(ink, gap, out=scratch_array((height, width), bool, mapped))
+        if disk_key is not None:
+            cache.put_array(disk_key, "barrier", barrier)
+
+    try:
+        ref = weakref.ref(img, lambda _, key=key: _barrier_cache.pop(key, None))
+    except TypeError:
+        return barrier
+    _barrier_cache[key] = (ref, barrier)
+    return barrier
+
+
+def fill_budget(img):
+    """ 开启防漏时的填充预算 (最大面积, 最大宽高)，按整页尺寸计算 """
+    width, height = img.size
+    return int(width * height * MAX_AREA_RATIO), int(max(width, height) * MAX_EXTENT_RATIO)
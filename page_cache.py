@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+# 默认缓存目录，可以通过环境变量 ARCHMARK_CACHE_DIR 修改
+DEFAULT_CACHE_DIR = os.environ.get("ARCHMARK_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "archmark"))
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3  # 4 GB
+
+# 进程内的文件哈希缓存：(路径, 大小, 修改时间) -> 哈希
+_hash_memo = {}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """ 计算源文件内容的 sha1，同一进程内按 (路径, 大小, 修改时间) 记忆，避免重复读取大文件 """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _hash_memo:
+        return _hash_memo[memo_key]
+
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    _hash_memo[memo_key] = digest
+    return digest
+
+
+class PageCache:
+    """ 按 (源文件哈希, 页码, 渲染/容差参数) 存放每页分析结果的磁盘缓存
+
+    每个缓存条目是一个目录，里面每个数组单独存为 .npy，读取时使用 mmap 映射，
+    不会把整页数据一次性读入内存。总大小超过 max_bytes 时按最近使用时间淘汰。
+    总大小只在第一次写入和淘汰时扫描目录，之后每次写入增量累加。
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._total = None  # 估计的缓存总大小（字节），第一次写入时才扫描
+        os.makedirs(self.root, exist_ok=True)
+
+    def key(self, source_hash, page, **params):
+        """ 生成缓存键，参数会按名字排序后参与哈希 """
+        payload = json.dumps({"source": source_hash, "page": page, "params": params}, sort_keys=True)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _touch(self, entry):
+        now = time.time()
+        os.utime(entry, (now, now))
+
+    def get_array(self, key, name, mmap_mode="r"):
+        """ 读取缓存的数组，不存在时返回 None """
+        entry = self._entry_dir(key)
+        path = os.path.join(entry, name + ".npy")
+        if not os.path.exists(path):
+            return None
+        try:
+            arr = np.load(path, mmap_mode=mmap_mode, allow_pickle=False)
+        except (OSError, ValueError) as e:
+            # 文件损坏时当作未命中
+            print(f"缓存文件损坏，已忽略: {path} ({e})")
+            return None
+        self._touch(entry)
+        return arr
+
+    def put_array(self, key, name, arr):
+        """ 写入数组，先写临时文件再替换，避免中途失败留下半个文件 """
+        entry = self._entry_dir(key)
+        os.makedirs(entry, exist_ok=True)
+        path = os.path.join(entry, name + ".npy")
+        tmp_path = path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.ascontiguousarray(arr), allow_pickle=False)
+        if self._total is None:
+            self._total = self.size()
+        else:
+            self._total += os.path.getsize(tmp_path) - (os.path.getsize(path) if os.path.exists(path) else 0)
+        os.replace(tmp_path, path)
+        self._touch(entry)
+        if self._total > self.max_bytes:
+            self.evict(keep=entry)
+
+    def get_arrays(self, key, names, mmap_mode="r"):
+        """ 一次读取多个数组，只要有一个不存在就返回 None """
+        arrays = {}
+        for name in names:
+            arr = self.get_array(key, name, mmap_mode)
+            if arr is None:
+                return None
+            arrays[name] = arr
+        return arrays
+
+    def put_arrays(self, key, arrays):
+        for name, arr in arrays.items():
+            self.put_array(key, name, arr)
+
+    def _entries(self):
+        """ 列出所有缓存条目及其大小和最近使用时间 """
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry = os.path.join(prefix_dir, key)
+                size = sum(entry_file.stat().st_size for entry_file in os.scandir(entry) if entry_file.is_file())
+                entries.append((os.stat(entry).st_mtime, size, entry))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self, keep=None):
+        """ 总大小超过上限时，按最近使用时间从旧到新删除条目，keep 指定的条目不会被删除 """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+        self._total = total
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+        self._total = 0
@@ -0,0 +1,25 @@
+import numpy as np
+
+from page_cache import file_hash
+
+# PDF 默认渲染倍率，1 个 PDF 点对应 RENDER_ZOOM 个像素
+RENDER_ZOOM = 2
+
+
+def render_page_array(file_path, page_no=0, zoom=RENDER_ZOOM, cache=None):
+    """ 把 PDF 的一页渲染成 (H, W, 3) 的 uint8 数组；命中磁盘缓存时返回只读的内存映射数组 """
+    key = None
+    if cache is not None:
+        key = cache.key(file_hash(file_path), page_no, kind="render", zoom=zoom)
+        pixels = cache.get_array(key, "pixels")
+        if pixels is not None:
+            return pixels
+
+    import fitz  # PyMuPDF
+    doc = fitz.open(file_path)
+    pix = doc[page_no].get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)[..., :3]
+
+    if cache is not None:
+        cache.put_array(key, "pixels", pixels)
+    return pixels
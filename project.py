@@ -0,0 +1,258 @@
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from page_cache import file_hash
+
+# 工程文件格式：
+#   文件头 MAGIC
+#   之后是一条条追加写入的记录：4 字节小端头长度 + JSON 头 + 二进制负载（长度见头里的 size）
+# 记录类型：
+#   source : 源文件引用（路径、哈希、页码、渲染倍率）
+#   edit   : 一次填色，负载为若干个变化区域的前/后像素块（zlib 压缩），头里的 tiles 记录各块的边界框和长度
+#   undo / redo : 撤销、重做
+# 每次保存只追加上次保存之后的新记录，保存耗时只与新增的编辑有关
+# 版本 2：edit 记录改为多个像素块（tiles），版本 1 的单块记录不再支持
+MAGIC_PREFIX = b"ARCHMARK-PROJECT "
+MAGIC = MAGIC_PREFIX + b"2\n"
+PROJECT_EXT = ".archmark"
+
+
+BAND = 512  # 压缩保存时像素块按行切分的高度
+
+
+class Delta:
+    """ 一次编辑的差异：若干个矩形像素块的编辑前/后内容，直接贴回图片即可撤销/重做
+
+    修改图片之前用 capture 保存要改动区域的原像素，改完后调用 finish 保存新像素，
+    这样只拷贝改动的区域，不需要复制整张图片。从工程文件读取时像素块是惰性加载的。
+    compress=True 时（大图模式）像素块按 BAND 行切开，逐块压缩后保存，内存里只有压缩数据，用到时再解压。
+    """
+
+    def __init__(self, info=None, loader=None, compress=False):
+        self.tiles = []  # [bbox, before, after]，bbox 为 (top, left, bottom, right)，bottom/right 不包含
+        self.info = info or {}
+        self._loader = loader
+        self.compress = compress
+
+    @property
+    def bboxes(self):
+        return [tile[0] for tile in self.tiles]
+
+    @property
+    def bbox(self):
+        """ 所有像素块的外接矩形 """
+        boxes = self.bboxes
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+    def capture(self, image, bbox):
+        """ 在修改 bbox 区域之前调用，保存编辑前的像素 """
+        top, left, bottom, right = bbox
+        if not self.compress:
+            self.tiles.append([tuple(bbox), np.asarray(image.crop((left, top, right, bottom))), None])
+            return
+        for band in range(top, bottom, BAND):
+            band_bbox = (band, left, min(band + BAND, bottom), right)
+            self.tiles.append([band_bbox, self._grab(image, band_bbox), None])
+
+    def finish(self, image):
+        """ 修改完成之后调用，保存每个像素块编辑后的像素 """
+        for tile in self.tiles:
+            if tile[2] is None:
+                tile[2] = self._grab(image, tile[0])
+        return self
+
+    def _grab(self, image, bbox):
+        top, left, bottom, right = bbox
+        tile = np.asarray(image.crop((left, top, right, bottom)))
+        return _encode_tile(tile) if self.compress else tile
+
+    def _tile(self, index, which):
+        slot = 1 if which == "before" else 2
+        tile = self.tiles[index][slot]
+        if isinstance(tile, bytes):
+            return _decode_tile(tile, self.tiles[index][0])
+        if tile is None:
+            tile = self.tiles[index][slot] = self._loader(index, which)
+        return tile
+
+    def peek(self, index, which):
+        """ 读取像素块但不缓存：已在内存中的直接返回，否则从工程文件解压一份，用完即可释放 """
+        slot = 1 if which == "before" else 2
+        tile = self.tiles[index][slot]
+        if isinstance(tile, bytes):
+            return _decode_tile(tile, self.tiles[index][0])
+        return tile if tile is not None else self._loader(index, which)
+
+    def encoded(self, index, which):
+        """ 压缩后的像素块，写入工程文件时使用 """
+        tile = self.tiles[index][1 if which == "before" else 2]
+        return tile if isinstance(tile, bytes) else _encode_tile(self._tile(index, which))
+
+    def before(self, index):
+        return self._tile(index, "before")
+
+    def after(self, index):
+        return self._tile(index, "after")
+
+    def apply(self, image, keep=True):
+        """ 重做：按顺序把编辑后的像素块贴回图片（原地修改）；keep 为 False 时不缓存从文件读取的像素块 """
+        for index, (bbox, _, _) in enumerate(self.tiles):
+            image.paste(self.after(index) if keep else self.peek(index, "after"), (bbox[1], bbox[0]))
+
+    def revert(self, image):
+        """ 撤销：倒序把编辑前的像素块贴回图片（原地修改），像素块之间有重叠时也能正确恢复 """
+        for index in reversed(range(len(self.tiles))):
+            bbox = self.tiles[index][0]
+            image.paste(self.before(index), (bbox[1], bbox[0]))
+
+
+def _encode_tile(arr):
+    return zlib.compress(np.ascontiguousarray(arr, dtype=np.uint8).tobytes(), 1)
+
+
+def _decode_tile(data, bbox):
+    top, left, bottom, right = bbox
+    return np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(bottom - top, right - left, 3).copy()
+
+
+class Project:
+    """ 工程文件：源文件引用 + 每页的编辑日志，保存时只追加新记录 """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.source = None
+        self.pending = []  # 尚未写入文件的记录：(头, 负载)
+        self.pages = {}  # 打开工程时重放得到的状态，页码 -> {"history": [Delta], "redo": [Delta]}
+
+    # ---- 记录编辑 ----
+    def set_source(self, source_path, page=0, zoom=None, **extra):
+        """ 记录源文件引用，extra 保存重建原图需要的其它参数（例如 DXF 的宽度和可见图层） """
+        self.source = {"type": "source", "path": os.path.abspath(source_path), "hash": file_hash(source_path),
+                       "page": page, "zoom": zoom, **extra}
+        self.pending.append((self.source, b""))
+
+    def page_state(self, page=0):
+        return self.pages.setdefault(page, {"history": [], "redo": []})
+
+    def record_edit(self, delta, page=0):
+        tiles = []
+        payload = []
+        for index, bbox in enumerate(delta.bboxes):
+            before = delta.encoded(index, "before")
+            after = delta.encoded(index, "after")
+            tiles.append([list(bbox), len(before), len(after)])
+            payload += [before, after]
+        header = {"type": "edit", "page": page, "tiles": tiles, "info": delta.info}
+        self.pending.append((header, b"".join(payload)))
+
+    def record_undo(self, page=0):
+        self.pending.append(({"type": "undo", "page": page}, b""))
+
+    def record_redo(self, page=0):
+        self.pending.append(({"type": "redo", "page": page}, b""))
+
+    # ---- 保存 ----
+    def save(self, path=None):
+        """ 追加写入尚未保存的记录；另存为新路径时先写入全部记录 """
+        if path is not None and path != self.path:
+            if self.path is not None and os.path.exists(self.path):
+                with open(self.path, "rb") as src, open(path, "wb") as dst:
+                    dst.write(src.read())
+            else:
+                with open(path, "wb") as dst:
+                    dst.write(MAGIC)
+            self.path = path
+        if self.path is None:
+            raise ValueError("工程文件路径为空")
+
+        if not os.path.exists(self.path):
+            with open(self.path, "wb") as f:
+                f.write(MAGIC)
+
+        with open(self.path, "ab") as f:
+            for header, payload in self.pending:
+                header = dict(header, size=len(payload))
+                header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+                f.write(struct.pack("<I", len(header_bytes)))
+                f.write(header_bytes)
+                f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        self.pending.clear()
+
+    # ---- 读取 ----
+    @classmethod
+    def open(cls, path):
+        """ 只读取记录头并重放撤销/重做，像素块在用到时才从文件中解压 """
+        project = cls(path)
+        with open(path, "rb") as f:
+            magic = f.readline(len(MAGIC) + 8)
+            if magic != MAGIC:
+                if magic.startswith(MAGIC_PREFIX):
+                    version = magic[len(MAGIC_PREFIX):].decode("ascii", "replace").strip()
+                    raise ValueError(f"不支持的工程文件版本 {version}: {path}")
+                raise ValueError(f"不是有效的工程文件: {path}")
+            while True:
+                length_bytes = f.read(4)
+                if len(length_bytes) < 4:
+                    break
+                (length,) = struct.unpack("<I", length_bytes)
+                header_bytes = f.read(length)
+                if len(header_bytes) < length:
+                    print(f"工程文件末尾记录不完整，已忽略: {path}")
+                    break
+                header = json.loads(header_bytes.decode("utf-8"))
+                if "size" not in header or "type" not in header or \
+                        (header["type"] == "edit" and "tiles" not in header):
+                    raise ValueError(f"工程文件记录格式不正确: {path}")
+                offset = f.tell()
+                f.seek(header["size"], os.SEEK_CUR)
+
+                kind = header["type"]
+                page = header.get("page", 0)
+                if kind == "source":
+                    project.source = header
+                elif kind == "edit":
+                    delta = Delta(header.get("info"), project._tile_loader(offset, header))
+                    delta.tiles = [[tuple(bbox), None, None] for bbox, _, _ in header["tiles"]]
+                    state = project.page_state(page)
+                    state["history"].append(delta)
+                    state["redo"].clear()
+                elif kind == "undo":
+                    state = project.page_state(page)
+                    if state["history"]:
+                        state["redo"].append(state["history"].pop())
+                elif kind == "redo":
+                    state = project.page_state(page)
+                    if state["redo"]:
+                        state["history"].append(state["redo"].pop())
+        return project
+
+    def _tile_loader(self, offset, header):
+        def load(index, which):
+            position = offset
+            for bbox, before_size, after_size in header["tiles"][:index]:
+                position += before_size + after_size
+            bbox, before_size, after_size = header["tiles"][index]
+            if which == "after":
+                position += before_size
+            with open(self.path, "rb") as f:
+                f.seek(position)
+                return _decode_tile(f.read(before_size if which == "before" else after_size), bbox)
+        return load
+
+    def source_changed(self):
+        """ 源文件是否已被修改或移动 """
+        path = self.source["path"]
+        return not os.path.exists(path) or file_hash(path) != self.source["hash"]
+
+    def restore(self, image, page=0):
+        """ 在源图片上原地依次贴上当前有效的编辑，返回该图片（只解压编辑后的像素块，贴完即释放） """
+        for delta in self.page_state(page)["history"]:
+            delta.apply(image, keep=False)
+        return image
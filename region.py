@@ -0,0 +1,171 @@
+import numpy as np
+
+from color_metric import DEFAULT_METRIC
+from util import EDGE_WIDTH, blend_edges, get_flood_spans, paint_spans, spans_bbox, spans_crop_mask
+
+IOU_CHUNK = 256  # 逐块合并区间时每块的行数，每块结束后检查一次能否提前退出
+
+
+def _iou_bound(intersection, area_a, area_b):
+    union = area_a + area_b - intersection
+    return intersection / union if union != 0 else 0
+
+
+def span_iou(a, b, threshold=None):
+    """ 两个区域对齐左上角之后的形状 IoU（与 util.calculate_iou 的定义一致），直接在行区间上计算
+
+    交集由同一行的区间合并得到，耗时与区间个数（对普通区域约等于行数）成正比，而不是与像素数成正比。
+    给出 threshold 时，一旦 IoU 的上界不超过它就提前返回这个上界，调用方用 iou > threshold 判断即可。
+    """
+    if a.height == 1 or a.width == 1 or b.height == 1 or b.width == 1:
+        return 0.0
+
+    # 上界 1：交集不超过较小的面积
+    if threshold is not None and _iou_bound(min(a.area, b.area), a.area, b.area) <= threshold:
+        return _iou_bound(min(a.area, b.area), a.area, b.area)
+
+    # 上界 2：每一行的交集不超过两者在该行的面积中较小的那个
+    h = min(a.height, b.height)
+    row_bound = np.minimum(a.row_areas[:h], b.row_areas[:h])
+    remaining = int(row_bound.sum())
+    if threshold is not None and _iou_bound(remaining, a.area, b.area) <= threshold:
+        return _iou_bound(remaining, a.area, b.area)
+
+    # 把两组区间换算成相对左上角的一维坐标：行号 * stride + 列号，行与行之间不会相连
+    stride = max(a.width, b.width) + 1
+    a_rows, b_rows = a.rows - a.top, b.rows - b.top
+    intersection = 0
+    for top in range(0, h, IOU_CHUNK):
+        bottom = min(top + IOU_CHUNK, h)
+        events, deltas = [], []
+        for region, rows in ((a, a_rows), (b, b_rows)):
+            lo, hi = np.searchsorted(rows, [top, bottom])
+            base = rows[lo:hi].astype(np.int64) * stride - region.left
+            events += [base + region.starts[lo:hi], base + region.ends[lo:hi]]
+            deltas += [np.ones(hi - lo, dtype=np.int8), np.full(hi - lo, -1, dtype=np.int8)]
+        events = np.concatenate(events)
+        order = np.argsort(events, kind="stable")
+        events = events[order]
+        # 覆盖次数为 2 的线段就是交集
+        coverage = np.cumsum(np.concatenate(deltas)[order])
+        intersection += int(np.sum(np.diff(events)[coverage[:-1] == 2]))
+
+        remaining -= int(row_bound[top:bottom].sum())
+        if threshold is not None and _iou_bound(intersection + remaining, a.area, b.area) <= threshold:
+            return _iou_bound(intersection + remaining, a.area, b.area)
+
+    return _iou_bound(intersection, a.area, b.area)
+
+
+class Region:
+    """ 紧凑的区域表示：按行的区间（run-length）+ 边界框，按需生成边界框内的打包位集
+
+    内存只和区域本身的大小有关，不再需要整页的 uint8 掩码和像素坐标列表。
+    rows/starts/ends 为绝对坐标，按 (行, 起点) 排序，ends 不包含。
+    """
+
+    def __init__(self, rows, starts, ends):
+        self.rows = np.asarray(rows, dtype=np.int32)
+        self.starts = np.asarray(starts, dtype=np.int32)
+        self.ends = np.asarray(ends, dtype=np.int32)
+        self.top = int(self.rows.min())
+        self.bottom = int(self.rows.max()) + 1
+        self.left = int(self.starts.min())
+        self.right = int(self.ends.max())
+        self.area = int(np.sum(self.ends - self.starts, dtype=np.int64))
+        self._bits = None
+        self._row_areas = None
+
+    @classmethod
+    def flood(cls, img, x, y, tolerance, metric=DEFAULT_METRIC):
+        """ 从 (x, y) 做填充得到的区域 """
+        return cls(*get_flood_spans(img, x, y, tolerance, metric))
+
+    @classmethod
+    def from_mask(cls, mask, top=0, left=0):
+        """ 由布尔掩码（左上角位于 (left, top)）生成区域，掩码为空时返回 None """
+        mask = np.asarray(mask, dtype=bool)
+        padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=np.int8)
+        padded[:, 1:-1] = mask
+        edges = np.diff(padded, axis=1)
+        rows, starts = np.nonzero(edges == 1)
+        _, ends = np.nonzero(edges == -1)
+        if len(rows) == 0:
+            return None
+        return cls(rows + top, starts + left, ends + left)
+
+    @property
+    def height(self):
+        return self.bottom - self.top
+
+    @property
+    def width(self):
+        return self.right - self.left
+
+    @property
+    def bbox(self):
+        """ (top, left, bottom, right)，bottom/right 不包含 """
+        return self.top, self.left, self.bottom, self.right
+
+    def mask(self):
+        """ 边界框内的布尔掩码 """
+        if self._bits is not None:
+            return np.unpackbits(self._bits, axis=1, count=self.width).astype(bool)
+        return spans_crop_mask(self.rows, self.starts, self.ends)[2]
+
+    @property
+    def bits(self):
+        """ 边界框内按行打包的位集，每像素 1 bit """
+        if self._bits is None:
+            self._bits = np.packbits(self.mask(), axis=1)
+        return self._bits
+
+    @property
+    def row_areas(self):
+        """ 每一行（相对 top）的像素个数 """
+        if self._row_areas is None:
+            self._row_areas = np.bincount(self.rows - self.top, weights=self.ends - self.starts,
+                                          minlength=self.height).astype(np.int64)
+        return self._row_areas
+
+    def page_mask(self, shape):
+        """ 整页的 uint8 掩码，只在需要兼容旧接口（例如调试输出）时使用 """
+        mask = np.zeros(shape, dtype=np.uint8)
+        mask[self.top:self.bottom, self.left:self.right] = self.mask()
+        return mask
+
+    def mark(self, visited):
+        """ 在整页的访问标记数组上标记本区域，按行分块处理，只改动区域覆盖的行 """
+        paint_spans(visited, self.rows, self.starts, self.ends, True)
+
+    def edge_bbox(self, shape, width=EDGE_WIDTH):
+        """ 包含外侧混合边缘的边界框，裁剪到 shape (H, W) 之内 """
+        return spans_bbox(self.rows, self.starts, self.ends, width, shape)
+
+    def apply_color(self, arr, color, target=None, width=EDGE_WIDTH, metric=DEFAULT_METRIC, visited=None):
+        """ 原地把区域涂成 color；给出原背景色 target 时再把填充色按覆盖率混合进外侧边缘（visited 见 blend_edges） """
+        paint_spans(arr, self.rows, self.starts, self.ends, color)
+        if target is not None:
+            blend_edges(arr, self.rows, self.starts, self.ends, color, target, width, metric, visited)
+
+    def intersect(self, top, left, mask):
+        """ 与左上角位于 (left, top) 的布尔掩码的交集，没有交集时返回 None """
+        y0, x0 = max(self.top, top), max(self.left, left)
+        y1, x1 = min(self.bottom, top + mask.shape[0]), min(self.right, left + mask.shape[1])
+        if y0 >= y1 or x0 >= x1:
+            return None
+        inside = self.mask()[y0 - self.top:y1 - self.top, x0 - self.left:x1 - self.left]
+        return Region.from_mask(inside & mask[y0 - top:y1 - top, x0 - left:x1 - left], y0, x0)
+
+    def iou(self, other, threshold=None):
+        """ 与另一个区域的形状 IoU，见 span_iou """
+        return span_iou(self, other, threshold)
+
+    def union(self, other):
+        """ 两个区域在页面坐标下的并集 """
+        top, left = min(self.top, other.top), min(self.left, other.left)
+        bottom, right = max(self.bottom, other.bottom), max(self.right, other.right)
+        mask = np.zeros((bottom - top, right - left), dtype=bool)
+        for region in (self, other):
+            mask[region.top - top:region.bottom - top, region.left - left:region.right - left] |= region.mask()
+        return Region.from_mask(mask, top, left)
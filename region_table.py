@@ -0,0 +1,247 @@
+import csv
+import json
+
+import numpy as np
+
+from region import Region
+
+POINTS_PER_INCH = 72
+METERS_PER_INCH = 0.0254
+
+
+def meters_per_pixel(zoom, drawing_scale=1.0):
+    """ 渲染后一个像素对应的实际长度（米）
+
+    PDF 按 zoom 倍渲染时 1 像素 = 1 / (72 * zoom) 英寸（图纸上的长度），再乘以图纸比例（1:100 时为 100）。
+    """
+    return METERS_PER_INCH / (POINTS_PER_INCH * zoom) * drawing_scale
+
+
+def regions_from_delta(delta):
+    """ 从编辑差异块中还原填色区域：编辑前后不同、编辑后等于填充色的像素
+
+    用于打开工程时重建区域表；与填色时记录的区域相比，会漏掉原本就是填充色的像素。
+    """
+    color = np.array(delta.info.get("color", ()), dtype=np.uint8)
+    if color.size != 3:
+        return []
+    regions = []
+    for i, ((top, left, _, _), _, _) in enumerate(delta.tiles):
+        # 逐块解压、用完即释放，不把整个工程的像素块留在内存里
+        before, after = delta.peek(i, "before")[..., :3], delta.peek(i, "after")[..., :3]
+        mask = np.any(before != after, axis=-1) & np.all(after == color, axis=-1)
+        filled = Region.from_mask(mask, top, left)
+        if filled is not None:
+            regions.append(filled)
+    return regions
+
+
+class RegionTable:
+    """ 填色区域表：每次填色新增若干行，记录编号、颜色、像素面积、边界框和重心
+
+    新区域覆盖旧区域时，只在两者边界框相交的部分把重叠像素从旧区域中减掉，不需要重新扫描整页。
+    每次编辑的改动记在日志里，撤销/重做与应用的撤销栈一一对应。
+    列都是 NumPy 数组，查询和汇总都是向量化的。
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.colors = np.zeros((0, 3), dtype=np.uint8)
+        self.areas = np.zeros(0, dtype=np.int64)
+        self.bboxes = np.zeros((0, 4), dtype=np.int64)  # (top, left, bottom, right)，bottom/right 不包含
+        self.sums = np.zeros((0, 2), dtype=np.float64)  # 像素 x、y 坐标之和，用于计算重心
+        self.alive = np.zeros(0, dtype=bool)
+        self.masks = []  # 每个区域边界框内的布尔掩码
+        self.done = []  # 已应用的编辑日志
+        self.undone = []  # 已撤销、可以重做的编辑日志
+
+    def __len__(self):
+        """ 仍然可见的区域个数（面积大于 0），与导出报表的行数一致 """
+        return len(self.select())
+
+    @property
+    def ids(self):
+        return np.flatnonzero(self.alive)
+
+    @property
+    def centroids(self):
+        """ 每个区域的重心 (x, y)，面积为 0 的区域为 nan """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self.sums / self.areas[:, None] + 0.5
+
+    def _grow(self, count):
+        self.colors = np.concatenate([self.colors, np.zeros((count, 3), dtype=np.uint8)])
+        self.areas = np.concatenate([self.areas, np.zeros(count, dtype=np.int64)])
+        self.bboxes = np.concatenate([self.bboxes, np.zeros((count, 4), dtype=np.int64)])
+        self.sums = np.concatenate([self.sums, np.zeros((count, 2))])
+        self.alive = np.concatenate([self.alive, np.zeros(count, dtype=bool)])
+
+    def _set_mask(self, rid, top, left, mask):
+        """ 更新区域掩码，并重新计算面积、重心和（收缩后的）边界框 """
+        ys, xs = np.nonzero(mask)
+        if len(ys) == 0:
+            self.masks[rid] = (top, left, mask[:0, :0])
+            self.areas[rid] = 0
+            self.sums[rid] = 0
+            self.bboxes[rid] = (top, left, top, left)
+            return
+        y0, y1, x0, x1 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+        self.masks[rid] = (top + y0, left + x0, mask[y0:y1, x0:x1])
+        self.areas[rid] = len(ys)
+        self.sums[rid] = (xs.sum() + len(xs) * left, ys.sum() + len(ys) * top)
+        self.bboxes[rid] = (top + y0, left + x0, top + y1, left + x1)
+
+    def _overlapping(self, bbox):
+        top, left, bottom, right = bbox
+        b = self.bboxes
+        hit = self.alive & (b[:, 0] < bottom) & (top < b[:, 2]) & (b[:, 1] < right) & (left < b[:, 3])
+        return np.flatnonzero(hit)
+
+    def _subtract(self, rid, top, left, mask):
+        """ 把 (top, left) 处的掩码从区域 rid 中减掉，返回被减掉的部分 (top, left, mask)，没有重叠时返回 None """
+        otop, oleft, omask = self.masks[rid]
+        y0, x0 = max(top, otop), max(left, oleft)
+        y1 = min(top + mask.shape[0], otop + omask.shape[0])
+        x1 = min(left + mask.shape[1], oleft + omask.shape[1])
+        if y0 >= y1 or x0 >= x1:
+            return None
+        removed = omask[y0 - otop:y1 - otop, x0 - oleft:x1 - oleft] & mask[y0 - top:y1 - top, x0 - left:x1 - left]
+        if not removed.any():
+            return None
+        updated = omask.copy()
+        updated[y0 - otop:y1 - otop, x0 - oleft:x1 - oleft] &= ~removed
+        self._set_mask(rid, otop, oleft, updated)
+        return y0, x0, removed
+
+    def _restore(self, rid, top, left, removed):
+        """ 把之前减掉的像素加回区域 rid """
+        otop, oleft, omask = self.masks[rid]
+        if omask.size == 0:
+            otop, oleft = top, left
+        ntop, nleft = min(otop, top), min(oleft, left)
+        nbottom = max(otop + omask.shape[0], top + removed.shape[0])
+        nright = max(oleft + omask.shape[1], left + removed.shape[1])
+        mask = np.zeros((nbottom - ntop, nright - nleft), dtype=bool)
+        mask[otop - ntop:otop - ntop + omask.shape[0], oleft - nleft:oleft - nleft + omask.shape[1]] = omask
+        mask[top - ntop:top - ntop + removed.shape[0], left - nleft:left - nleft + removed.shape[1]] |= removed
+        self._set_mask(rid, ntop, nleft, mask)
+
+    def _apply(self, entry):
+        """ 应用一条编辑日志：先从旧区域中减掉被覆盖的像素，再加入新区域 """
+        entry["removed"] = []
+        for rid in entry["ids"]:
+            top, left, mask = self.masks[rid]
+            for other in self._overlapping(self.bboxes[rid]):
+                removed = self._subtract(other, top, left, mask)
+                if removed is not None:
+                    entry["removed"].append((other,) + removed)
+            self.alive[rid] = True
+
+    def push(self, regions, color):
+        """ 记录一次填色：regions 为 Region 列表，color 为填充色 """
+        start = len(self.masks)
+        self._grow(len(regions))
+        for i, filled in enumerate(regions):
+            self.masks.append(None)
+            self._set_mask(start + i, filled.top, filled.left, filled.mask())
+            self.colors[start + i] = color[:3]
+        entry = {"ids": list(range(start, start + len(regions)))}
+        self._apply(entry)
+        self.done.append(entry)
+        self.undone.clear()
+
+    def undo(self):
+        if not self.done:
+            return
+        entry = self.done.pop()
+        self.alive[entry["ids"]] = False
+        for rid, top, left, removed in reversed(entry["removed"]):
+            self._restore(rid, top, left, removed)
+        self.undone.append(entry)
+
+    def redo(self):
+        if not self.undone:
+            return
+        entry = self.undone.pop()
+        self._apply(entry)
+        self.done.append(entry)
+
+    def rebuild(self, history, redo=()):
+        """ 由撤销栈和重做栈中的差异块重建区域表（打开工程时使用） """
+        self.clear()
+        for delta in history:
+            self.push(regions_from_delta(delta), delta.info.get("color", (0, 0, 0)))
+        redo = list(redo)
+        for delta in reversed(redo):
+            # 按重做的顺序临时应用一遍，得到每条日志，然后再全部撤销
+            self.push(regions_from_delta(delta), delta.info.get("color", (0, 0, 0)))
+        for _ in redo:
+            self.undo()
+
+    def region_at(self, x, y, color=None):
+        """ 覆盖像素 (x, y) 的区域（颜色为 color，多个时取最新的），返回 (top, left, mask)，没有时返回 None """
+        ids = self._overlapping((y, x, y + 1, x + 1))
+        if color is not None:
+            ids = ids[np.all(self.colors[ids] == np.array(color[:3], dtype=np.uint8), axis=1)]
+        for rid in ids[::-1].tolist():
+            top, left, mask = self.masks[rid]
+            if mask[y - top, x - left]:
+                return self.masks[rid]
+        return None
+
+    def select(self, color=None, min_area=0):
+        """ 按颜色和最小面积筛选，返回区域编号数组 """
+        keep = self.alive & (self.areas >= max(min_area, 1))
+        if color is not None:
+            keep &= np.all(self.colors == np.array(color[:3], dtype=np.uint8), axis=1)
+        return np.flatnonzero(keep)
+
+    def area_by_color(self):
+        """ 每种颜色的总像素面积，返回 [(颜色, 面积), ...]，按面积从大到小排列 """
+        ids = self.select()
+        if len(ids) == 0:
+            return []
+        colors, inverse = np.unique(self.colors[ids], axis=0, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=self.areas[ids]).astype(np.int64)
+        order = np.argsort(-totals, kind="stable")
+        return [(tuple(int(c) for c in colors[i]), int(totals[i])) for i in order]
+
+    def rows(self, meters_per_px=None):
+        """ 报表的每一行；给出 meters_per_px 时同时换算成平方米 """
+        ids = self.select()
+        centroids = self.centroids
+        rows = []
+        for rid in ids.tolist():
+            top, left, bottom, right = (int(v) for v in self.bboxes[rid])
+            row = {"id": rid, "color": "#%02x%02x%02x" % tuple(int(c) for c in self.colors[rid]),
+                   "area_px": int(self.areas[rid]), "left": left, "top": top, "right": right, "bottom": bottom,
+                   "centroid_x": round(float(centroids[rid, 0]), 2), "centroid_y": round(float(centroids[rid, 1]), 2)}
+            if meters_per_px is not None:
+                row["area_m2"] = round(row["area_px"] * meters_per_px ** 2, 4)
+            rows.append(row)
+        return rows
+
+    def to_csv(self, path, meters_per_px=None):
+        rows = self.rows(meters_per_px)
+        fields = ["id", "color", "area_px"] + (["area_m2"] if meters_per_px is not None else []) + \
+                 ["left", "top", "right", "bottom", "centroid_x", "centroid_y"]
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        return len(rows)
+
+    def to_json(self, path, meters_per_px=None):
+        rows = self.rows(meters_per_px)
+        summary = []
+        for color, area in self.area_by_color():
+            item = {"color": "#%02x%02x%02x" % color, "area_px": area}
+            if meters_per_px is not None:
+                item["area_m2"] = round(area * meters_per_px ** 2, 4)
+            summary.append(item)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"meters_per_px": meters_per_px, "by_color": summary, "regions": rows}, f,
+                      ensure_ascii=False, indent=2)
+        return len(rows)
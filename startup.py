@@ -0,0 +1,61 @@
+import importlib
+import threading
+import time
+
+# 记录每个模块第一次导入的耗时（秒），包括延迟导入和后台预热
+IMPORT_TIMES = {}
+
+# 窗口显示后在后台线程里预热的模块，按首次使用的先后顺序排列
+WARM_MODULES = ["numpy", "PIL.Image", "color_metric", "util", "region", "page_cache", "pdf_utils", "project",
+                "vector_export", "leak_guard", "region_table", "engine", "fitz", "dxf_import", "ezdxf", "dxf_render"]
+
+
+def timed_import(name):
+    """ 导入模块并记录耗时，已经导入过的模块直接返回 """
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMES.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+class LazyModule:
+    """ 延迟导入的模块代理：第一次访问属性时才真正导入 """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = timed_import(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+def warm_up(names=WARM_MODULES, callback=None):
+    """ 在后台守护线程中依次导入模块，结束后调用 callback(report) """
+    def run():
+        for name in names:
+            try:
+                timed_import(name)
+            except ImportError as e:
+                print(f"预热模块 {name} 失败: {e}")
+        if callback is not None:
+            callback(import_report())
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def import_report():
+    """ 按耗时从高到低列出模块导入时间 """
+    lines = [f"{name}: {seconds * 1000:.0f} ms" for name, seconds in
+             sorted(IMPORT_TIMES.items(), key=lambda item: item[1], reverse=True)]
+    return "\n".join(lines)
@@ -1,10 +1,33 @@
 import numpy as np
-import math
 from collections import deque
-import matplotlib.pyplot as plt
 from PIL import Image
 import os
 import random
+from color_metric import DEFAULT_METRIC, color_distance, lazy_similarity
+
+EDGE_WIDTH = 1  # 填色后按覆盖率混合的边缘宽度（像素），0 表示不处理边缘
+
+
+class FillBudgetExceeded(Exception):
+    """ 填充区域超出面积或边界框预算（多半是从缺口漏出去了），填充被提前中止 """
+
+    def __init__(self, area, bbox):
+        top, left, bottom, right = bbox
+        super().__init__(f"已填充 {area} 像素，范围 {right - left}x{bottom - top}")
+        self.area = area
+        self.bbox = bbox
+
+
+class BlockedSimilarity:
+    """ 把屏障掩码中的像素视为不相似，用于防漏填充 """
+
+    def __init__(self, similar, barrier):
+        self.similar = similar
+        self.barrier = barrier
+        self.shape = similar.shape
+
+    def __getitem__(self, key):
+        return self.similar[key] & ~self.barrier[key]
 
 def calculate_iou(region1, region2, debug=False):
     # 获取每个掩码的边界框
@@ -40,6 +63,9 @@ def calculate_iou(region1, region2, debug=False):
 
     # 如果是调试模式，保存掩码图像
     if debug:
+        # matplotlib 导入很慢，只在调试时才需要
+        import matplotlib.pyplot as plt
+
         # 创建目录
         debug_dir = './test/debug'
         os.makedirs(debug_dir, exist_ok=True)
@@ -74,63 +100,195 @@ def calculate_iou(region1, region2, debug=False):
 
     return iou_value
 
-def color_similarity(c1, c2, threshold=50):
-    r_diff = c1[0] - c2[0]
-    g_diff = c1[1] - c2[1]
-    b_diff = c1[2] - c2[2]
-    distance = math.sqrt(r_diff**2 + g_diff**2 + b_diff**2)
-    return distance < threshold
+def color_similarity(c1, c2, threshold=50, metric=DEFAULT_METRIC):
+    return bool(color_distance(c1, c2, metric) < threshold)
 
-def get_flood_mask(img, x, y, tolerance):
-    """ 获取Flood Fill区域的掩码，用于标记填充区域，使用BFS代替递归 """
-    width, height = img.size
-    pixels = img.load()
+def _row_runs(row):
+    """ 找出布尔行中所有连续 True 的区间，返回 (起点数组, 终点数组)，终点不包含 """
+    padded = np.concatenate(([False], row, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges[0::2], edges[1::2]
 
-    # 获取点击位置的颜色
-    target_color = pixels[x, y]
-    fill_pixels = []
+def flood_spans(similar, x, y, max_area=None, max_extent=None):
+    """ 在相似度图上从 (x, y) 做四连通的扫描线填充，以行区间为单位做BFS
+    similar 可以是布尔数组，也可以是 LazySimilarity 这类按行取值的对象
+    返回按 (行, 起点) 排序的 (rows, starts, ends) 三个数组，ends 不包含
+    面积超过 max_area 或者宽、高超过 max_extent 时立即抛出 FillBudgetExceeded """
+    height, width = similar.shape
+    if not similar[y, x]:
+        return np.array([y]), np.array([x]), np.array([x + 1])
 
-    # 创建一个mask标记当前填充区域
-    mask = np.zeros((height, width), dtype=np.uint8)
-    visited = np.zeros((height, width), dtype=bool)
-    
-    # 使用BFS实现填充
-    queue = deque([(x, y)])  # 队列初始化，存储待处理的像素位置
-    visited[y, x] = True  # 标记起始点已访问
-    mask[y, x] = 1  # 标记起始点为填充区域
+    runs = {}
+
+    def row_runs(r):
+        if r not in runs:
+            runs[r] = _row_runs(similar[r])
+        return runs[r]
+
+    starts, ends = row_runs(y)
+    first = int(np.searchsorted(ends, x, side="right"))
+    visited = {(y, first)}
+    queue = deque([(y, first)])
+    out_rows, out_starts, out_ends = [], [], []
+    area, top, bottom, left, right = 0, y, y + 1, x, x + 1
 
-    # BFS填充
     while queue:
-        cx, cy = queue.popleft()  # 从队列中取出当前处理的像素位置
-
-        # 检查四个方向的邻居
-        for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-            nx, ny = cx + dx, cy + dy
-
-            # 检查边界
-            if 0 <= nx < width and 0 <= ny < height:
-                if not visited[ny, nx] and color_similarity(pixels[nx, ny], target_color, tolerance):
-                    visited[ny, nx] = True  # 标记为已访问
-                    mask[ny, nx] = 1  # 标记为填充区域
-                    queue.append((nx, ny))  # 将邻居加入队列，等待处理
-                    fill_pixels.append((nx, ny))
-    
-    # 随机选取 k 个点，计算它们的距离
-    # def distance_to_edge(x, y):
-    #     """ 计算坐标 (x, y) 到四个边缘的最小距离 """
-    #     return min(x, width - x - 1, y, height - y - 1)
-
-    # # 随机选择 k 个像素点
-    # random_pixels = random.sample(fill_pixels, min(k, len(fill_pixels)))
-
-    # 计算距离边缘最远的像素
-    # max_distance = -1
-    # central_pixel = None
-    # for px, py in random_pixels:
-    #     dist = distance_to_edge(px, py)
-    #     if dist > max_distance:
-    #         max_distance = dist
-    #         central_pixel = (px, py)
+        r, i = queue.popleft()
+        s, e = runs[r][0][i], runs[r][1][i]
+        out_rows.append(r)
+        out_starts.append(s)
+        out_ends.append(e)
+
+        if max_area is not None or max_extent is not None:
+            area += int(e - s)
+            top, bottom = min(top, r), max(bottom, r + 1)
+            left, right = min(left, int(s)), max(right, int(e))
+            if (max_area is not None and area > max_area) or \
+                    (max_extent is not None and max(bottom - top, right - left) > max_extent):
+                raise FillBudgetExceeded(area, (top, left, bottom, right))
+
+        # 上下两行中与 [s, e) 重叠的区间都是四连通的邻居
+        for nr in (r - 1, r + 1):
+            if 0 <= nr < height:
+                ns, ne = row_runs(nr)
+                lo = int(np.searchsorted(ne, s, side="right"))
+                hi = int(np.searchsorted(ns, e, side="left"))
+                for j in range(lo, hi):
+                    if (nr, j) not in visited:
+                        visited.add((nr, j))
+                        queue.append((nr, j))
+
+    rows = np.array(out_rows)
+    starts = np.array(out_starts)
+    ends = np.array(out_ends)
+    order = np.lexsort((starts, rows))
+    return rows[order], starts[order], ends[order]
+
+def spans_crop_mask(rows, starts, ends):
+    """ 把行区间画成边界框内的布尔掩码（差分 + 累加），返回 (top, left, mask)
+    同一行的区间互不重叠，差分和累加值都在 -1~1 之间，用 int8 即可 """
+    top, left, right = rows.min(), starts.min(), ends.max()
+    diff = np.zeros((rows.max() - top + 1, right - left + 1), dtype=np.int8)
+    np.add.at(diff, (rows - top, starts - left), 1)
+    np.add.at(diff, (rows - top, ends - left), -1)
+    return top, left, np.cumsum(diff, axis=1, dtype=np.int8)[:, :-1] > 0
+
+def spans_to_mask(rows, starts, ends, shape):
+    """ 把行区间画成整页的 uint8 掩码 """
+    mask = np.zeros(shape, dtype=np.uint8)
+    if len(rows) == 0:
+        return mask
+    top, left, crop = spans_crop_mask(rows, starts, ends)
+    mask[top:top + crop.shape[0], left:left + crop.shape[1]] = crop
+    return mask
+
+def paint_spans(arr, rows, starts, ends, color, tile=512):
+    """ 按行区间原地上色：每 tile 行为一块，在块的边界框内一次性赋值，适合内存映射的大图
+    arr 也可以是布尔掩码（例如访问标记），color 为 True """
+    if len(rows) == 0:
+        return
+    color = np.asarray(color, dtype=arr.dtype)
+    bands = rows // tile
+    for band in np.unique(bands):
+        in_band = bands == band
+        top, left, mask = spans_crop_mask(rows[in_band], starts[in_band], ends[in_band])
+        arr[top:top + mask.shape[0], left:left + mask.shape[1]][mask] = color
+
+def spans_bbox(rows, starts, ends, pad=0, shape=None):
+    """ 行区间的边界框 (top, left, bottom, right)，bottom/right 不包含
+    pad 把边界框向外扩若干像素，给出 shape (H, W) 时裁剪到图像范围内 """
+    top, left = int(rows.min()) - pad, int(starts.min()) - pad
+    bottom, right = int(rows.max()) + 1 + pad, int(ends.max()) + pad
+    if shape is not None:
+        top, left = max(top, 0), max(left, 0)
+        bottom, right = min(bottom, shape[0]), min(right, shape[1])
+    return top, left, bottom, right
+
+def _dilate8(mask):
+    """ 八邻域膨胀一个像素 """
+    out = mask.copy()
+    out[1:, :] |= mask[:-1, :]
+    out[:-1, :] |= mask[1:, :]
+    grown = out.copy()
+    out[:, 1:] |= grown[:, :-1]
+    out[:, :-1] |= grown[:, 1:]
+    return out
+
+def blend_edges(arr, rows, starts, ends, color, target, width=EDGE_WIDTH, metric=DEFAULT_METRIC, visited=None,
+                tile=512):
+    """ 按覆盖率把填充色混合进区域外侧 width 像素宽的边缘，消除抗锯齿线条旁的白边
+
+    边缘像素 c 看作背景色 T 和线条色 L 的混合，覆盖率 a = clip(1 - d(c, T) / d(L, T))，
+    新颜色为 c + a * (F - T)：纯线条像素不变，接近背景的像素接近填充色 F。
+    距离 d 按填色时的颜色度量 metric 计算，L 取外圈中离 T 最远的颜色。
+    每 tile 行为一块计算，临时数组只有一块那么大，内存映射的大图也不会整块读进内存；
+    需要保留的只有边缘像素，和区域的周长成正比。返回改动的像素个数。
+    给出整页的访问标记 visited 时把边缘也标记为已访问：混合后的颜色接近填充色，不能再作为新的种子。
+    """
+    if len(rows) == 0 or width <= 0:
+        return 0
+    top, left, bottom, right = spans_bbox(rows, starts, ends, width + 1, arr.shape[:2])
+    target = np.array(target[:3], dtype=np.float32)
+    halo = width + 1
+
+    line_dist = 0.0
+    edges = []  # 每块的边缘像素 (ys, xs, 颜色, 距离)
+    for band_top in range(top, bottom, tile):
+        band_bottom = min(band_top + tile, bottom)
+        # 上下多取 halo 行，膨胀结果在本块内与整块计算相同
+        lo, hi = max(band_top - halo, top), min(band_bottom + halo, bottom)
+        core = np.zeros((hi - lo, right - left), dtype=bool)
+        near = (rows >= lo) & (rows < hi)
+        if near.any():
+            crop_top, crop_left, crop = spans_crop_mask(rows[near], starts[near], ends[near])
+            core[crop_top - lo:crop_top - lo + crop.shape[0], crop_left - left:crop_left - left + crop.shape[1]] = crop
+
+        grown = core
+        for _ in range(width):
+            grown = _dilate8(grown)
+        inner = slice(band_top - lo, band_bottom - lo)
+        ring = (grown & ~core)[inner]
+        outer = (_dilate8(grown) & ~core)[inner]
+        if visited is not None:
+            visited[band_top:band_bottom, left:right] |= ring
+
+        ys, xs = np.nonzero(outer)
+        outer_pixels = arr[ys + band_top, xs + left].astype(np.float32)
+        outer_dist = color_distance(outer_pixels, target, metric)
+        line_dist = max(line_dist, float(outer_dist.max(initial=0.0)))
+        in_ring = ring[ys, xs]
+        edges.append((ys[in_ring] + band_top, xs[in_ring] + left, outer_pixels[in_ring], outer_dist[in_ring]))
+    if line_dist == 0:
+        return 0
+
+    shift = np.array(color[:3], dtype=np.float32) - target
+    changed = 0
+    for ys, xs, pixels, dist in edges:
+        coverage = np.clip(1.0 - dist / line_dist, 0.0, 1.0)
+        blended = pixels + coverage[:, None] * shift
+        arr[ys, xs] = np.clip(np.rint(blended), 0, 255).astype(np.uint8)
+        changed += len(ys)
+    return changed
+
+def get_flood_spans(img, x, y, tolerance, metric=DEFAULT_METRIC, barrier=None, max_area=None, max_extent=None):
+    """ 获取Flood Fill区域的行区间 (rows, starts, ends)
+    相似度通过量化颜色查找表按行计算，填充使用扫描线BFS代替逐像素BFS
+    barrier 为防漏的屏障掩码（点击位置本身在屏障上时忽略），预算参数见 flood_spans """
+    target_color = img.getpixel((x, y))
+    similar = lazy_similarity(img, target_color, tolerance, metric)
+    if barrier is not None and not barrier[y, x]:
+        similar = BlockedSimilarity(similar, barrier)
+    return flood_spans(similar, x, y, max_area, max_extent)
+
+def get_flood_mask(img, x, y, tolerance, metric=DEFAULT_METRIC):
+    """ 获取Flood Fill区域的掩码，用于标记填充区域 """
+    width, height = img.size
+
+    rows, starts, ends = get_flood_spans(img, x, y, tolerance, metric)
+    mask = spans_to_mask(rows, starts, ends, (height, width))
+
+    ys, xs = np.nonzero(mask)
+    fill_pixels = list(zip(xs.tolist(), ys.tolist()))
 
     return mask, fill_pixels
 
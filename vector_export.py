@@ -0,0 +1,164 @@
+import numpy as np
+
+from pdf_utils import RENDER_ZOOM, render_page_array
+
+
+def trace_loops(mask):
+    """ 沿像素边界追踪掩码的轮廓，返回闭合折线列表，每条为 (N, 2) 的 (x, y) 网格坐标
+
+    每条边界边只会出现在一条折线里，所以用 even-odd 规则填充即可正确处理孔洞，
+    不需要区分外轮廓和内轮廓。耗时与轮廓长度成正比，而不是与面积成正比。
+    """
+    mask = np.asarray(mask, dtype=bool)
+    h, w = mask.shape
+    padded = np.zeros((h + 2, w + 2), dtype=bool)
+    padded[1:-1, 1:-1] = mask
+    stride = w + 1  # 顶点编号 = y * stride + x
+
+    # 水平边：位于网格线 y 上，内部在下方时从左到右，内部在上方时从右到左
+    above, below = padded[:-1, 1:-1], padded[1:, 1:-1]
+    ys, xs = np.nonzero(below & ~above)
+    src = [ys * stride + xs]
+    dst = [ys * stride + xs + 1]
+    ys, xs = np.nonzero(above & ~below)
+    src.append(ys * stride + xs + 1)
+    dst.append(ys * stride + xs)
+
+    # 竖直边：位于网格线 x 上，内部在右侧时从下到上，内部在左侧时从上到下
+    left, right = padded[1:-1, :-1], padded[1:-1, 1:]
+    ys, xs = np.nonzero(right & ~left)
+    src.append((ys + 1) * stride + xs)
+    dst.append(ys * stride + xs)
+    ys, xs = np.nonzero(left & ~right)
+    src.append(ys * stride + xs)
+    dst.append((ys + 1) * stride + xs)
+
+    src = np.concatenate(src)
+    dst = np.concatenate(dst)
+    if len(src) == 0:
+        return []
+
+    # 按起点排序，方便查找从某个顶点出发的边（每个顶点最多两条）
+    order = np.argsort(src, kind="stable")
+    src = src[order]
+    dst = dst[order]
+    src_list = src.tolist()
+    dst_list = dst.tolist()
+    first_out = dict(zip(reversed(src_list), range(len(src_list) - 1, -1, -1)))
+    used = [False] * len(src_list)
+
+    loops = []
+    for start in range(len(src_list)):
+        if used[start]:
+            continue
+        vertices = [src_list[start]]
+        edge = start
+        while True:
+            used[edge] = True
+            vertex = dst_list[edge]
+            if vertex == vertices[0]:
+                break
+            vertices.append(vertex)
+            edge = first_out[vertex]
+            if used[edge]:
+                edge += 1  # 对角相接的顶点有两条出边，取另一条
+        points = np.array(vertices, dtype=np.int64)
+        loops.append(_drop_collinear(np.stack([points % stride, points // stride], axis=-1)))
+    return loops
+
+
+def _drop_collinear(points):
+    """ 去掉直线段中间的顶点，只保留拐点 """
+    prev_dir = points - np.roll(points, 1, axis=0)
+    next_dir = np.roll(points, -1, axis=0) - points
+    turning = np.any(prev_dir != next_dir, axis=1)
+    return points[turning]
+
+
+def merge_boxes(boxes):
+    """ 把重叠的边界框 (top, left, bottom, right) 合并成互不重叠的若干个 """
+    boxes = [list(box) for box in boxes]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for box in boxes:
+            for other in result:
+                if box[0] < other[2] and other[0] < box[2] and box[1] < other[3] and other[1] < box[3]:
+                    other[0], other[1] = min(other[0], box[0]), min(other[1], box[1])
+                    other[2], other[3] = max(other[2], box[2]), max(other[3], box[3])
+                    merged = True
+                    break
+            else:
+                result.append(box)
+        boxes = result
+    return [tuple(box) for box in boxes]
+
+
+def filled_regions(image, source_pixels, deltas, grow=1):
+    """ 找出当前图像中被填色的区域，返回 [(颜色, [(N, 2) 像素坐标折线, ...]), ...]
+
+    只在撤销栈中各次编辑的边界框内比较当前图像和原图，不扫描整页。
+    grow 把区域向外扩若干像素，让填充垫到抗锯齿线条下面，不留白边。
+    """
+    image_arr = np.asarray(image)
+    source_arr = np.asarray(source_pixels)
+    colors = {tuple(delta.info["color"]) for delta in deltas if "color" in delta.info}
+    height, width = image_arr.shape[:2]
+
+    regions = {}
+    for top, left, bottom, right in merge_boxes(bbox for delta in deltas for bbox in delta.bboxes):
+        top, left = max(top - grow, 0), max(left - grow, 0)
+        bottom, right = min(bottom + grow, height), min(right + grow, width)
+        current = image_arr[top:bottom, left:right]
+        changed = np.any(current != source_arr[top:bottom, left:right], axis=-1)
+
+        box_colors = colors or {tuple(c) for c in np.unique(current[changed], axis=0).tolist()}
+        for color in box_colors:
+            mask = changed & np.all(current == np.array(color, dtype=np.uint8), axis=-1)
+            if not mask.any():
+                continue
+            for _ in range(grow):
+                mask = _dilate4(mask)
+            for loop in trace_loops(mask):
+                regions.setdefault(color, []).append(loop + (left, top))
+    return list(regions.items())
+
+
+def _dilate4(mask):
+    """ 四邻域膨胀一个像素 """
+    out = mask.copy()
+    out[1:, :] |= mask[:-1, :]
+    out[:-1, :] |= mask[1:, :]
+    out[:, 1:] |= mask[:, :-1]
+    out[:, :-1] |= mask[:, 1:]
+    return out
+
+
+def export_vector_pdf(source, image, deltas, out_path, cache=None):
+    """ 把填色区域转成只有填充的矢量路径，画在原 PDF 页面内容的下方并另存
+
+    source 是工程里记录的源文件引用，需要是 PDF。
+    """
+    import fitz  # PyMuPDF
+
+    zoom = source.get("zoom") or RENDER_ZOOM
+    source_pixels = render_page_array(source["path"], source["page"], zoom, cache=cache)
+    regions = filled_regions(image, source_pixels, deltas)
+
+    doc = fitz.open(source["path"])
+    page = doc[source["page"]]
+    # 像素坐标 -> 渲染时的页面坐标 -> 未旋转的页面坐标
+    matrix = fitz.Matrix(1 / zoom, 1 / zoom) * page.derotation_matrix
+
+    shape = page.new_shape()
+    for color, loops in regions:
+        for loop in loops:
+            points = [fitz.Point(float(x), float(y)) * matrix for x, y in loop]
+            shape.draw_polyline(points + points[:1])
+        # 同一颜色的所有轮廓组成一条路径，用 even-odd 规则处理孔洞
+        shape.finish(fill=tuple(c / 255 for c in color), color=None, even_odd=True, closePath=True, width=0)
+    shape.commit(overlay=False)  # 画在原有内容下面，线条仍然在最上层
+
+    doc.save(out_path, garbage=3, deflate=True)
+    return sum(len(loops) for _, loops in regions)
@@ -0,0 +1,105 @@
+import os
+import tempfile
+import weakref
+
+import numpy as np
+from PIL import Image
+
+# 内存映射文件存放目录，应该放在本地磁盘上
+WORK_DIR = os.environ.get("ARCHMARK_WORK_DIR", tempfile.gettempdir())
+TILE = 512  # 按行分块处理时每块的行数
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def scratch_array(shape, dtype, mapped=False):
+    """ 全页大小的临时数组（访问标记、屏障掩码等），初始为 0
+
+    mapped 时放在 WORK_DIR 下的匿名临时文件里（不需要手动删除），和大图模式的工作图像一样由操作系统按需换入换出。
+    """
+    if not mapped:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(tempfile.TemporaryFile(prefix="archmark-", dir=WORK_DIR), dtype=dtype, mode="w+", shape=shape)
+
+
+class WorkingImage:
+    """ 以 NumPy 数组为底层存储的工作图像，提供应用里用到的那部分 PIL 接口
+
+    mapped=True 时像素存放在本地磁盘的内存映射文件中，由操作系统按需换入换出，
+    可以打开比内存还大的图纸；所有修改都是原地进行的，不会复制整张图。
+    """
+
+    mode = "RGB"
+
+    def __init__(self, arr, path=None):
+        self.arr = arr
+        self.path = path
+        self.mapped = path is not None
+        if path is not None:
+            self._finalizer = weakref.finalize(self, _remove_file, path)
+
+    @classmethod
+    def from_array(cls, source, mapped=False):
+        """ 从 (H, W, 3) 数组创建工作图像；mapped 时按行分块拷贝到新的映射文件，不会整张读入内存 """
+        source = np.asarray(source)[..., :3]
+        if not mapped:
+            return cls(np.array(source, dtype=np.uint8))
+        fd, path = tempfile.mkstemp(prefix="archmark-", suffix=".raw", dir=WORK_DIR)
+        os.close(fd)
+        arr = np.memmap(path, dtype=np.uint8, mode="w+", shape=source.shape[:2] + (3,))
+        for top in range(0, source.shape[0], TILE):
+            arr[top:top + TILE] = source[top:top + TILE]
+        return cls(arr, path)
+
+    @classmethod
+    def from_pil(cls, image, mapped=False):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return cls.from_array(np.asarray(image), mapped)
+
+    def __array__(self, dtype=None, copy=None):
+        arr = np.asarray(self.arr)
+        return arr if dtype is None else arr.astype(dtype)
+
+    @property
+    def size(self):
+        return self.arr.shape[1], self.arr.shape[0]
+
+    @property
+    def width(self):
+        return self.arr.shape[1]
+
+    @property
+    def height(self):
+        return self.arr.shape[0]
+
+    def getpixel(self, xy):
+        x, y = xy
+        return tuple(int(c) for c in self.arr[y, x])
+
+    def crop(self, box):
+        """ 返回 (left, top, right, bottom) 区域的 PIL 图像（只拷贝这一块） """
+        left, top, right, bottom = box
+        return Image.fromarray(np.array(self.arr[top:bottom, left:right]))
+
+    def paste(self, image, xy):
+        """ 把一块 PIL 图像或数组原地写回到 (left, top) """
+        left, top = xy
+        tile = np.asarray(image)[..., :3]
+        self.arr[top:top + tile.shape[0], left:left + tile.shape[1]] = tile
+
+    def save(self, path):
+        # PIL 的编码器需要完整图像，这里会临时生成一份拷贝
+        Image.fromarray(np.asarray(self.arr)).save(path)
+
+    def close(self):
+        """ 释放内存映射并删除映射文件 """
+        if self.mapped:
+            self.arr = None
+            self._finalizer()
+